@@ -0,0 +1,359 @@
+"""Load test of the voice pipeline with many concurrent guilds.
+
+Commands of TastyListen (!album) and YoutubeBot (!play) are driven through the
+real VoiceManager, with fake contexts and voice clients, and a stubbed YoutubeDL
+returning local files. The audio sources are the real ones: FFmpeg decodes the
+MP3 fixtures and the fake voice clients read their frames, in real time by default.
+
+Reported for each number of guilds:
+    - throughput: songs played per second
+    - time to first audio: from the command to the first frame read
+    - inter-track gap: from the end of a song to the first frame of the next one
+      (for albums played gapless, the duration of the read switching to the next song)
+    - CPU per stream: CPU seconds (bot + FFmpeg) per second of played stream
+    - memory per guild: RSS growth divided by the number of guilds
+
+Usage:
+    python3 -m benchmarks.load [--guilds 10 100 1000] [--songs DIR] [--save results.json]
+    python3 -m benchmarks.load --baseline results.json --threshold 0.2  # Fails on regressions
+
+Requirements: discord.py, youtube_dl, ffmpeg
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import resource
+import tempfile
+import threading
+import subprocess
+
+from src.create_db import create_csv
+from tests.fakes import FakeBot, FakeMember, FakeTextChannel
+from src.voice import youtube_bot
+from src.voice.voice_manager import VoiceManager
+from src.voice.tastylisten import TastyListen
+from src.voice.youtube_bot import YoutubeBot
+
+
+FRAME_DURATION = 0.02  # Discord plays 20ms frames
+COMPARED = {  # Reported value -> True if higher is better
+    'throughput': True,
+    'ttfa_p50': False,
+    'ttfa_p95': False,
+    'gap_p50': False,
+    'gap_p95': False,
+    'cpu_per_stream': False,
+    'memory_per_guild_kb': False,
+}
+
+
+class Stats:
+    """Timings collected by the fake voice clients.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.ttfa = []
+        self.gaps = []
+        self.played = 0
+        self.stream_time = 0
+        self.done = None  # asyncio.Event set when all songs have been played
+        self.expected = 0
+        self.loop = None
+
+    def song_ended(self, duration: float):
+        with self.lock:
+            self.played += 1
+            self.stream_time += duration
+            if self.played >= self.expected:
+                self.loop.call_soon_threadsafe(self.done.set)
+
+
+class FakeVoiceClient:
+    """Reads the frames of the audio sources like the discord player does.
+    """
+    def __init__(self, channel, stats: Stats, realtime: bool):
+        self.channel = channel
+        self.stats = stats
+        self.realtime = realtime
+        self.source = None
+        self.connected = True
+        self.playing = False
+        self.stopped = threading.Event()
+        self.requested_at = None  # When the first song of the guild was requested
+        self.ended_at = None  # When the last song ended
+
+    def is_connected(self) -> bool:
+        return self.connected
+
+    def is_playing(self) -> bool:
+        return self.playing
+
+    def play(self, source, after: callable):
+        self.source = source
+        self.playing = True
+        self.stopped.clear()
+        threading.Thread(target=self.run, args=(source, after), daemon=True).start()
+
+    def run(self, source, after: callable):
+        start = None
+        frames = 0  # Frames read since the start
+        track_frames = 0  # Frames of the current song
+        tracks = getattr(source, 'tracks', 1)  # Songs chained by a gapless source
+        while not self.stopped.is_set():
+            read_start = time.perf_counter()
+            data = source.read()
+            if start is None:
+                start = time.perf_counter()
+                with self.stats.lock:
+                    if self.ended_at is None:
+                        self.stats.ttfa.append(start - self.requested_at)
+                    else:
+                        self.stats.gaps.append(start - self.ended_at)
+            elif getattr(source, 'tracks', 1) != tracks:
+                # The next song started within this read
+                tracks = source.tracks
+                with self.stats.lock:
+                    self.stats.gaps.append(time.perf_counter() - read_start)
+                self.stats.song_ended(track_frames * FRAME_DURATION)
+                track_frames = 0
+            if not data:
+                break
+
+            frames += 1
+            track_frames += 1
+            if self.realtime:
+                delay = start + frames * FRAME_DURATION - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+
+        self.playing = False
+        self.ended_at = time.perf_counter()
+        self.stats.song_ended(track_frames * FRAME_DURATION)
+        after(None)
+
+    def stop(self):
+        self.stopped.set()
+
+    async def disconnect(self):
+        self.stop()
+        self.connected = False
+
+
+class FakeVoiceChannel:
+    def __init__(self, channel_id: int, stats: Stats, realtime: bool):
+        self.id = channel_id
+        self.stats = stats
+        self.realtime = realtime
+        self.members = [FakeMember(channel_id)]
+        self.voice_client = None
+        self.requested_at = None  # Set by the load test before the first command
+
+    async def connect(self) -> FakeVoiceClient:
+        self.voice_client = FakeVoiceClient(self, self.stats, self.realtime)
+        self.voice_client.requested_at = self.requested_at
+        return self.voice_client
+
+
+class FakeContext:
+    def __init__(self, guild_id: int, stats: Stats, realtime: bool):
+        voice_channel = FakeVoiceChannel(guild_id, stats, realtime)
+        self.guild = type('Guild', (), {'id': guild_id})
+        self.channel = FakeTextChannel(guild_id)
+        self.author = type('Author', (), {
+            'id': guild_id,
+            'voice': type('Voice', (), {'channel': voice_channel}),
+        })
+        self.voice_channel = voice_channel
+
+    async def send(self, *args, **kwargs):
+        pass
+
+
+class StubYoutubeDL:
+    """Returns a local song for any URL, after a simulated extraction latency.
+    """
+    def __init__(self, paths: list, latency: float):
+        self.paths = paths
+        self.latency = latency
+
+    def extract_info(self, url: str, download: bool = False, process: bool = True) -> dict:
+        time.sleep(self.latency)
+        path = self.paths[hash(url) % len(self.paths)]
+        return {'title': url, 'url': path, 'id': url}
+
+
+def create_fixtures(songs_dir: str, albums: int, songs: int, duration: float):
+    """Generate MP3 files of sine tones, laid out like the songs library.
+    """
+    for album in range(albums):
+        album_dir = os.path.join(songs_dir, f'Album {album}')
+        os.makedirs(album_dir, exist_ok=True)
+        for song in range(1, songs + 1):
+            subprocess.run(
+                ['ffmpeg', '-nostdin', '-loglevel', 'error', '-y',
+                 '-f', 'lavfi', '-i', f'sine=frequency={220 * (song + 1)}:duration={duration}',
+                 '-ac', '2', '-b:a', '128k',
+                 os.path.join(album_dir, f'Tastycool - 0{song} Song {song}.mp3')],
+                check=True,
+            )
+
+
+def rss_kb() -> int:
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * resource.getpagesize() // 1024
+
+
+def cpu_time() -> float:
+    usage = 0
+    for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN):
+        r = resource.getrusage(who)
+        usage += r.ru_utime + r.ru_stime
+    return usage
+
+
+def percentile(values: list, q: float) -> float:
+    if not values:
+        return 0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+async def run_load(guilds: int, args: argparse.Namespace) -> dict:
+    """Half of the guilds listen to an album, the other half queue Youtube songs.
+    """
+    loop = asyncio.get_running_loop()
+    stats = Stats()
+    stats.loop = loop
+    stats.done = asyncio.Event()
+
+    bot = FakeBot(loop)
+    voice_manager = VoiceManager(bot)
+    tasty_listen = TastyListen(bot, voice_manager)
+    youtube = YoutubeBot(bot, voice_manager)
+    catalog = tasty_listen.song_handler.catalog
+    youtube_bot.ytdl_pool.ytdl = lambda: StubYoutubeDL(catalog.paths, args.ytdl_latency)
+    youtube_bot.ytdl_pool.max_pending = guilds * args.yt_songs  # Never answer 'queue busy'
+    youtube_bot.download_cache.threshold = float('inf')  # Never download the stubbed songs
+    youtube_bot.ytdl_cache.entries.clear()
+
+    contexts = [FakeContext(guild_id, stats, not args.fast) for guild_id in range(guilds)]
+    album_name = catalog.album_names[0]
+    album_songs = len(catalog.album_paths[album_name])
+    stats.expected = sum(album_songs if i % 2 == 0 else args.yt_songs for i in range(guilds))
+
+    rss_before, cpu_before = rss_kb(), cpu_time()
+    start = time.perf_counter()
+
+    async def drive(i: int, context: FakeContext):
+        await asyncio.sleep(random.random() * args.ramp)  # Users do not all arrive at once
+        context.voice_channel.requested_at = time.perf_counter()
+        if i % 2 == 0:
+            # The cogs aren't added to a bot, so the commands are called through their callback
+            await tasty_listen.tastyalbum.callback(tasty_listen, context, *album_name.split())
+        else:
+            for song in range(args.yt_songs):
+                await youtube.yt_play.callback(youtube, context, url=f'https://youtu.be/guild{i}-song{song}')
+
+    await asyncio.gather(*(drive(i, context) for i, context in enumerate(contexts)))
+    rss_peak = rss_kb()
+    try:
+        await asyncio.wait_for(stats.done.wait(), timeout=args.timeout)
+    except asyncio.TimeoutError:
+        print(f'Timeout: {stats.played}/{stats.expected} songs played.')
+    wall = time.perf_counter() - start
+    await asyncio.sleep(0.5)  # Let the last FFmpeg processes be waited for
+
+    tasty_listen.watch_catalog.cancel()
+    voice_manager.reap_sessions.cancel()
+    youtube.save_download_cache.cancel()
+    return {
+        'guilds': guilds,
+        'songs': stats.played,
+        'throughput': stats.played / wall,
+        'ttfa_p50': percentile(stats.ttfa, 0.5),
+        'ttfa_p95': percentile(stats.ttfa, 0.95),
+        'gap_p50': percentile(stats.gaps, 0.5),
+        'gap_p95': percentile(stats.gaps, 0.95),
+        'cpu_per_stream': (cpu_time() - cpu_before) / max(stats.stream_time, 1e-9),
+        'memory_per_guild_kb': max(0, rss_peak - rss_before) / guilds,
+    }
+
+
+def compare(results: list, baseline: list, threshold: float) -> list:
+    """Return the regressions of the results compared to the baseline.
+    """
+    regressions = []
+    baseline = {result['guilds']: result for result in baseline}
+    for result in results:
+        reference = baseline.get(result['guilds'])
+        if reference is None:
+            continue
+        for name, higher_is_better in COMPARED.items():
+            old, new = reference[name], result[name]
+            if old == 0:
+                continue
+            change = (new - old) / old
+            if (higher_is_better and change < -threshold) or (not higher_is_better and change > threshold):
+                regressions.append(f'{result["guilds"]} guilds: {name} {old:.4g} -> {new:.4g} ({change:+.0%})')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--guilds', type=int, nargs='+', default=[10, 100, 1000])
+    parser.add_argument('--songs', help='Directory of MP3 songs, fixtures are generated if not given')
+    parser.add_argument('--duration', type=float, default=2, help='Duration (s) of the generated songs')
+    parser.add_argument('--yt-songs', type=int, default=3, help='Songs queued by each Youtube guild')
+    parser.add_argument('--ytdl-latency', type=float, default=0.2, help='Simulated extraction time (s)')
+    parser.add_argument('--ramp', type=float, default=1, help='Seconds over which the guilds arrive')
+    parser.add_argument('--fast', action='store_true', help='Read the frames as fast as possible')
+    parser.add_argument('--timeout', type=float, default=600, help='Maximum duration (s) of a run')
+    parser.add_argument('--save', help='Write the results to this JSON file')
+    parser.add_argument('--baseline', help='Compare the results to this JSON file')
+    parser.add_argument('--threshold', type=float, default=0.2, help='Tolerated relative regression')
+    args = parser.parse_args()
+
+    # Many guilds means many FFmpeg pipes
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        songs_dir = os.path.abspath(args.songs) if args.songs else os.path.join(tmp_dir, 'songs')
+        if not args.songs:
+            create_fixtures(songs_dir, albums=2, songs=3, duration=args.duration)
+        create_csv(songs_dir, os.path.join(tmp_dir, 'songs.csv'))
+
+        os.chdir(tmp_dir)  # TastyListen reads ./songs.csv
+        try:
+            # The cogs tasks are bound to the default event loop
+            loop = asyncio.get_event_loop()
+            results = []
+            for guilds in args.guilds:
+                result = loop.run_until_complete(run_load(guilds, args))
+                results.append(result)
+                print(' '.join(
+                    f'{k}={v:.4g}' if isinstance(v, float) else f'{k}={v}'
+                    for k, v in result.items()
+                ))
+        finally:
+            os.chdir(cwd)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for regression in regressions:
+            print('Regression:', regression)
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""Compare the playlist queue with the previous list of (context, fn, args) tuples.
+
+Fills many guild queues, then drains them, and reports the time and memory used.
+
+Usage: python3 -m benchmarks.playlist_queue [guilds] [songs_per_guild]
+"""
+import sys
+import time
+import tracemalloc
+
+from src.voice.playlist import Playlist, QueueEntry
+from src.voice.providers import SourceProvider
+
+
+class FakeContext:
+    """Stands for the discord Context that was kept for every song.
+    """
+    def __init__(self, guild_id: int):
+        self.guild_id = guild_id
+        self.channel_id = guild_id
+        self.author_id = guild_id
+        self.message = {'content': '!music', 'id': guild_id}
+
+
+async def get_audiosource(path: str):
+    pass
+
+
+class FakeProvider(SourceProvider):
+    kind = 'catalog'
+
+    async def resolve(self, path: str, offset: float = 0, volume: float = 1) -> tuple:
+        pass
+
+
+def fill_list(guilds: int, songs: int) -> list:
+    queues = []
+    for guild_id in range(guilds):
+        context = FakeContext(guild_id)
+        queue = []
+        for song in range(songs):
+            queue.append((context, get_audiosource, [f'songs/{song}.mp3']))
+        queues.append(queue)
+    return queues
+
+
+def drain_list(queues: list):
+    for queue in queues:
+        while queue:
+            queue.pop(0)
+
+
+def fill_playlist(guilds: int, songs: int) -> list:
+    provider = FakeProvider()
+    queues = []
+    for guild_id in range(guilds):
+        queue = Playlist()
+        for song in range(songs):
+            queue.append(QueueEntry(guild_id, guild_id, provider, f'songs/{song}.mp3'))
+        queues.append(queue)
+    return queues
+
+
+def drain_playlist(queues: list):
+    for queue in queues:
+        while queue:
+            queue.popleft()
+
+
+def bench(name: str, fill: callable, drain: callable, guilds: int, songs: int):
+    tracemalloc.start()
+    start = time.perf_counter()
+    queues = fill(guilds, songs)
+    fill_time = time.perf_counter() - start
+    memory = tracemalloc.get_traced_memory()[0] / 2**20
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    drain(queues)
+    drain_time = time.perf_counter() - start
+    print(f'{name}: fill {fill_time:.2f} s, drain {drain_time:.2f} s, '
+          f'{memory:.1f} MB ({memory * 1024 / guilds:.1f} kB per guild)')
+
+
+if __name__ == '__main__':
+    guilds = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    songs = int(sys.argv[2]) if len(sys.argv) > 2 else 10000
+    bench('list', fill_list, drain_list, guilds, songs)
+    bench('Playlist', fill_playlist, drain_playlist, guilds, songs)
@@ -0,0 +1,73 @@
+"""Measure the search index on a synthetic catalog.
+
+Reports the time to build the index, and the mean time of exact, prefix,
+fuzzy (with a typo) and multi-word queries.
+
+Usage: python3 -m benchmarks.search [songs] [queries]
+"""
+import sys
+import time
+import random
+
+from src.catalog import Catalog, Song
+from src.search import CatalogSearch
+
+
+SONGS_PER_ALBUM = 12
+
+
+def random_word(rng: random.Random) -> str:
+    return ''.join(rng.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(rng.randint(3, 9)))
+
+
+def synthetic_catalog(songs: int, rng: random.Random) -> Catalog:
+    """Create a catalog of random song and album names, drawn from a vocabulary of words.
+    """
+    words = [random_word(rng) for _ in range(max(100, songs // 4))]
+    albums = [
+        f'Album {" ".join(rng.sample(words, 2))} {album_id}'
+        for album_id in range(songs // SONGS_PER_ALBUM + 1)
+    ]
+    catalog = []
+    for song_id in range(songs):
+        album = albums[song_id // SONGS_PER_ALBUM]
+        song_name = ' '.join(rng.sample(words, rng.randint(1, 4))).title()
+        catalog.append(Song('Tastycool', album, song_name, song_id % SONGS_PER_ALBUM, f'songs/{song_id}.mp3'))
+    return Catalog(catalog)
+
+
+def typo(word: str, rng: random.Random) -> str:
+    position = rng.randrange(len(word))
+    return word[:position] + rng.choice('abcdefghijklmnopqrstuvwxyz') + word[position+1:]
+
+
+def bench(name: str, search: callable, queries: list):
+    start = time.perf_counter()
+    found = sum(1 for query in queries if search(query))
+    elapsed = time.perf_counter() - start
+    print(f'{name}: {elapsed / len(queries) * 1e6:.1f} µs per query, '
+          f'{found}/{len(queries)} queries with results')
+
+
+def main(songs: int, queries: int):
+    rng = random.Random(0)
+    catalog = synthetic_catalog(songs, rng)
+
+    start = time.perf_counter()
+    index = CatalogSearch(catalog)
+    print(f'{songs} songs: index built in {time.perf_counter() - start:.2f} s, '
+          f'{len(index.songs.vocabulary)} distinct tokens')
+
+    names = [song.song_name for song in rng.sample(catalog.songs, queries)]
+    words = [rng.choice(name.split()).lower() for name in names]
+    bench('exact word', index.find_songs, words)
+    bench('prefix', index.find_songs, [word[:3] for word in words])
+    bench('typo', index.find_songs, [typo(word, rng) for word in words])
+    bench('full name', index.find_songs, names)
+    bench('album', index.find_albums, [song.album for song in rng.sample(catalog.songs, queries)])
+
+
+if __name__ == '__main__':
+    songs = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    queries = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    main(songs, queries)
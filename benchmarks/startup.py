@@ -0,0 +1,57 @@
+"""Compare the cold start of the catalog loaders.
+
+Each loader runs in a fresh interpreter, so that import time is measured too.
+The stdlib loader is the one used by the bot, the pandas one is the previous path.
+
+Usage: python3 -m benchmarks.startup [songs.csv] [runs]
+"""
+import os
+import sys
+import time
+import subprocess
+
+
+LOADERS = {
+    'stdlib csv': 'from src.catalog import Catalog; Catalog.from_csv({csv_path!r})',
+    'pandas': 'import pandas as pd; pd.read_csv({csv_path!r}, sep=",")',
+}
+
+
+def run_loader(code: str) -> tuple:
+    """Run the code in a new interpreter.
+
+    Return the wall time (s) and the max RSS (MB) of the child process.
+    """
+    code += '; import resource; print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)'
+    start = time.perf_counter()
+    output = subprocess.run([sys.executable, '-c', code], check=True, capture_output=True)
+    elapsed = time.perf_counter() - start
+    max_rss = int(output.stdout.split()[-1]) / 1024
+    return elapsed, max_rss
+
+
+def main(csv_path: str, runs: int):
+    # Baseline for the interpreter itself
+    empty, empty_rss = min(run_loader('pass') for _ in range(runs))
+    print(f'empty interpreter: {empty*1000:.1f} ms, {empty_rss:.1f} MB')
+
+    for name, code in LOADERS.items():
+        code = code.format(csv_path=csv_path)
+        try:
+            timings = [run_loader(code) for _ in range(runs)]
+        except subprocess.CalledProcessError:
+            print(f'{name}: failed (missing dependency?)')
+            continue
+        best = min(t for t, _ in timings)
+        rss = max(r for _, r in timings)
+        print(f'{name}: {best*1000:.1f} ms ({(best - empty)*1000:.1f} ms over baseline), '
+              f'{rss:.1f} MB ({rss - empty_rss:.1f} MB over baseline)')
+
+
+if __name__ == '__main__':
+    csv_path = sys.argv[1] if len(sys.argv) > 1 else 'songs.csv'
+    runs = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    if not os.path.isfile(csv_path):
+        print(f'{csv_path} not found, create it with --init first.')
+        sys.exit(1)
+    main(csv_path, runs)
@@ -0,0 +1,104 @@
+"""Measure the CPU used per concurrent stream, with and without the Opus cache.
+
+Both paths are run as fast as possible with N concurrent streams of the same song:
+    - pcm: ffmpeg decodes to PCM, python scales the volume and encodes with libopus
+      (what FFmpegPCMAudio + PCMVolumeTransformer do)
+    - opus: ffmpeg passes the cached Opus packets through (what FFmpegOpusAudio does)
+
+The CPU time (bot process + ffmpeg children) is divided by the number of streams.
+
+Usage: python3 -m benchmarks.stream_cpu path/to/song.mp3 [streams]
+"""
+import os
+import sys
+import time
+import resource
+import tempfile
+import subprocess
+import threading
+
+from src.voice import opus_cache
+
+
+FRAME_SIZE = 3840  # 20ms of 48kHz stereo s16le
+
+
+def cpu_time() -> float:
+    """CPU time of this process and its finished children.
+    """
+    usage = 0
+    for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN):
+        r = resource.getrusage(who)
+        usage += r.ru_utime + r.ru_stime
+    return usage
+
+
+def pcm_stream(path: str):
+    try:
+        import audioop
+    except ImportError:  # Removed in python 3.13
+        audioop = None
+    try:
+        from discord.opus import Encoder
+        encoder = Encoder()
+    except Exception:  # discord.py or libopus unavailable
+        encoder = None
+
+    process = subprocess.Popen(
+        ['ffmpeg', '-nostdin', '-loglevel', 'error', '-i', path,
+         '-f', 's16le', '-ar', '48000', '-ac', '2', 'pipe:1'],
+        stdout=subprocess.PIPE,
+    )
+    while True:
+        frame = process.stdout.read(FRAME_SIZE)
+        if len(frame) < FRAME_SIZE:
+            break
+        if audioop is not None:
+            frame = audioop.mul(frame, 2, opus_cache.CACHE_VOLUME)
+        if encoder is not None:
+            encoder.encode(frame, encoder.SAMPLES_PER_FRAME)
+    process.wait()
+
+
+def opus_stream(path: str):
+    process = subprocess.Popen(
+        ['ffmpeg', '-nostdin', '-loglevel', 'error', '-i', path,
+         '-c:a', 'copy', '-f', 'opus', 'pipe:1'],
+        stdout=subprocess.PIPE,
+    )
+    while process.stdout.read(4096):
+        pass
+    process.wait()
+
+
+def run(stream, path: str, streams: int) -> tuple:
+    """Run the streams concurrently.
+
+    Return the wall time and the CPU time per stream.
+    """
+    threads = [threading.Thread(target=stream, args=(path,)) for _ in range(streams)]
+    start_wall, start_cpu = time.perf_counter(), cpu_time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start_wall, (cpu_time() - start_cpu) / streams
+
+
+def main(path: str, streams: int):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        opus_path = os.path.join(tmp_dir, 'song.opus')
+        if not opus_cache.transcode(path, opus_path):
+            print('Transcoding failed, is ffmpeg built with libopus?')
+            sys.exit(1)
+
+        for name, stream, source in [('pcm', pcm_stream, path), ('opus', opus_stream, opus_path)]:
+            wall, cpu = run(stream, source, streams)
+            print(f'{name}: {streams} streams in {wall:.2f} s, {cpu:.3f} CPU s per stream')
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print('Usage: python3 -m benchmarks.stream_cpu path/to/song.mp3 [streams]')
+        sys.exit(0)
+    main(sys.argv[1], int(sys.argv[2]) if len(sys.argv) > 2 else 10)
@@ -5,42 +5,91 @@ from dotenv import load_dotenv
 from discord.ext.commands import Bot
 
 from src.tastybot import TastyBot
+from src.shards import ShardReporter, supervise
+from src.instrumentation import Instrumentation
 from src.create_db import create_csv
+from src.voice import opus_cache
+from src.voice.http_files import HttpFiles
 from src.voice.voice_manager import VoiceManager
+from src.voice.session_store import SQLiteSessionStore
 from src.voice.tastylisten import TastyListen
-from src.voice.youtube_bot import YoutubeBot
+from src.voice.youtube_bot import YoutubeBot, download_cache
 
 
-if len(sys.argv) > 1:
-    if '--help' in sys.argv or '-h' in sys.argv:
-        print('Help for TastyBot:')
-        print(f'\tpython3 {sys.argv[0]}: start the TastyBot')
-        print(f'\tpython3 {sys.argv[0]} --init: create the database file')
-        print(f'\tpython3 {sys.argv[0]} --help: print this help message')
-        sys.exit(0)
+PREFIX = '!'
+SPLIT_TOKEN = '::'
 
-    if '--init' == sys.argv[1] and len(sys.argv) == 2:
-        create_csv('songs', 'songs.csv')
-        print('DB created.')
-        sys.exit(0)
 
-    print('Error when parsing arguments.')
-    print('Use --help.')
-    sys.exit(1)
+def run_bot(shard_id: int = None, shard_count: int = None, status_queue=None):
+    """Start the bot.
 
+    If a shard is given, the bot only handles the guilds of this shard,
+    and its sessions, metrics and download cache are kept apart from the other shards.
+    """
+    load_dotenv()
+    TOKEN = os.getenv('DISCORD_TOKEN')
 
-load_dotenv()
-TOKEN = os.getenv('DISCORD_TOKEN')
-PREFIX = '!'
-SPLIT_TOKEN = '::'
+    bot = Bot(command_prefix=PREFIX, shard_id=shard_id, shard_count=shard_count)
+    bot.add_cog(TastyBot(bot, split_token=SPLIT_TOKEN))
+
+    # Metrics, served on http://127.0.0.1:METRICS_PORT/metrics and/or dumped into METRICS_JSON
+    # Each shard uses METRICS_PORT + shard_id and METRICS_JSON suffixed by its shard_id
+    METRICS_PORT = os.getenv('METRICS_PORT')
+    METRICS_JSON = os.getenv('METRICS_JSON')
+    suffix = '' if shard_id is None else f'-{shard_id}'
+    bot.add_cog(Instrumentation(
+        bot,
+        port=int(METRICS_PORT) + (shard_id or 0) if METRICS_PORT else None,
+        json_path=f'{METRICS_JSON}{suffix}' if METRICS_JSON else None,
+    ))
+    if status_queue is not None:
+        bot.add_cog(ShardReporter(bot, shard_id, status_queue))
+
+    # Voice bots
+    voice_manager = VoiceManager(bot, store=SQLiteSessionStore(f'sessions{suffix}.db'))
+    bot.add_cog(voice_manager)
+    bot.add_cog(TastyListen(bot, voice_manager))
+    bot.add_cog(YoutubeBot(bot, voice_manager, cache_dir=f'yt_cache{suffix}'))
+    # Audio files of the file server, streamed only under HTTP_FILES_ROOT
+    bot.add_cog(HttpFiles(bot, voice_manager, root=os.getenv('HTTP_FILES_ROOT')))
+
+    bot.run(TOKEN)
+    download_cache.save_index()  # Play counts recorded since the last periodic save
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        if '--help' in sys.argv or '-h' in sys.argv:
+            print('Help for TastyBot:')
+            print(f'\tpython3 {sys.argv[0]}: start the TastyBot')
+            print(f'\tpython3 {sys.argv[0]} --shards N: start the TastyBot as N shard processes')
+            print(f'\tpython3 {sys.argv[0]} --init: create the database file, analyzing the loudness and silences of the songs')
+            print(f'\tpython3 {sys.argv[0]} --init --incremental: update the database file, parsing and analyzing the changed songs only')
+            print(f'\tpython3 {sys.argv[0]} --cache: pre-encode the songs into the Opus cache')
+            print(f'\tpython3 {sys.argv[0]} --help: print this help message')
+            sys.exit(0)
+
+        if '--init' == sys.argv[1] and len(sys.argv) == 2:
+            create_csv('songs', 'songs.csv')
+            print('DB created.')
+            sys.exit(0)
+
+        if '--init' == sys.argv[1] and sys.argv[2:] == ['--incremental']:
+            counts = create_csv('songs', 'songs.csv', incremental=True)
+            print('DB updated: {added} added, {updated} updated, {removed} removed, {analyzed} analyzed.'.format(**counts))
+            sys.exit(0)
+
+        if '--cache' == sys.argv[1] and len(sys.argv) == 2:
+            counts = opus_cache.build_cache('songs.csv')
+            print('Opus cache built: {transcoded} transcoded, {cached} already cached, {failed} failed.'.format(**counts))
+            sys.exit(0)
 
-bot = Bot(command_prefix=PREFIX)
-bot.add_cog(TastyBot(bot))
+        if '--shards' == sys.argv[1] and len(sys.argv) == 3 and sys.argv[2].isdigit():
+            supervise(run_bot, int(sys.argv[2]))
+            sys.exit(0)
 
-# Voice bots
-voice_manager = VoiceManager(bot)
-bot.add_cog(voice_manager)
-bot.add_cog(TastyListen(bot, voice_manager))
-bot.add_cog(YoutubeBot(bot, voice_manager))
+        print('Error when parsing arguments.')
+        print('Use --help.')
+        sys.exit(1)
 
-bot.run(TOKEN)
+    run_bot()
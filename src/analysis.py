@@ -0,0 +1,97 @@
+"""Offline analysis of the songs, stored in the catalog.
+
+Each file is decoded once by FFmpeg to measure its integrated loudness (EBU R128),
+its true peak, its duration and the silences at its start and end.
+Playback then normalizes the songs with the stored values, without any runtime analysis.
+
+Requirements: ffmpeg
+"""
+import re
+import math
+import subprocess
+
+
+ANALYSIS_FIELDS = ('loudness', 'peak', 'duration', 'lead_silence', 'trail_silence')
+TARGET_LOUDNESS = -14  # LUFS, songs are normalized to this loudness
+MAX_PEAK = -1  # dBTP, the gain never pushes the true peak above
+SILENCE_THRESHOLD = -50  # dB
+SILENCE_MIN_DURATION = 0.5  # Seconds, shorter silences are kept
+
+LOUDNESS_RE = re.compile(r'I:\s+(-?[\d.]+|-inf) LUFS')
+PEAK_RE = re.compile(r'Peak:\s+(-?[\d.]+|-inf) dBFS')
+TIME_RE = re.compile(r'time=(\d+):(\d+):([\d.]+)')
+SILENCE_START_RE = re.compile(r'silence_start: (-?[\d.]+)')
+SILENCE_END_RE = re.compile(r'silence_end: ([\d.]+)')
+
+
+def parse_analysis(output: str) -> dict:
+    """Read the analysis from the FFmpeg logs.
+
+    Return None if the logs miss some values.
+    """
+    loudness = LOUDNESS_RE.findall(output)
+    peak = PEAK_RE.findall(output)
+    times = TIME_RE.findall(output)
+    if not loudness or not peak or not times:
+        return None
+
+    hours, minutes, seconds = times[-1]
+    duration = int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+    # Silences as [start, end], the last one may last until the end of the file
+    silences = []
+    for line in output.splitlines():
+        start = SILENCE_START_RE.search(line)
+        if start:
+            silences.append([max(0, float(start.group(1))), duration])
+        end = SILENCE_END_RE.search(line)
+        if end and silences:
+            silences[-1][1] = float(end.group(1))
+
+    lead_silence = silences[0][1] if silences and silences[0][0] < 0.01 else 0
+    trail_silence = duration - silences[-1][0] if silences and silences[-1][1] >= duration - 0.05 else 0
+    if lead_silence >= duration:  # Silent file
+        lead_silence, trail_silence = 0, 0
+
+    return {
+        'loudness': float(loudness[-1]),  # -inf for a silent file
+        'peak': float(peak[-1]),
+        'duration': round(duration, 3),
+        'lead_silence': round(lead_silence, 3),
+        'trail_silence': round(trail_silence, 3),
+    }
+
+
+def analyze(path: str) -> dict:
+    """Analyze the song with FFmpeg.
+
+    Return None if the file couldn't be analyzed.
+    """
+    try:
+        process = subprocess.run(
+            [
+                'ffmpeg', '-nostdin', '-hide_banner', '-i', path, '-vn',
+                '-af', f'silencedetect=noise={SILENCE_THRESHOLD}dB:d={SILENCE_MIN_DURATION},'
+                       'ebur128=peak=true:framelog=verbose',
+                '-f', 'null', '-',
+            ],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            text=True,
+            errors='replace',
+        )
+    except OSError:  # FFmpeg is not installed
+        return None
+    if process.returncode != 0:
+        return None
+    return parse_analysis(process.stderr)
+
+
+def normalization_gain(loudness: float, peak: float) -> float:
+    """Return the linear gain bringing the song to the target loudness,
+    without pushing its peak above MAX_PEAK.
+    """
+    if loudness is None or peak is None or math.isinf(loudness):
+        return 1
+    gain_db = min(TARGET_LOUDNESS - loudness, MAX_PEAK - peak)
+    return 10 ** (gain_db / 20)
@@ -0,0 +1,153 @@
+"""In-memory song catalog.
+
+Built once from the songs database, it indexes songs by path
+and by album so that every lookup is done in constant time.
+
+The database is a plain csv file read and written with the standard library,
+so that the bot does not need pandas at runtime.
+"""
+import os
+import csv
+
+from src.analysis import ANALYSIS_FIELDS, normalization_gain
+
+
+CATALOG_FIELDS = ('artist', 'album', 'song_name', 'song_id', 'path') + ANALYSIS_FIELDS
+
+
+class Song:
+    """A single song of the catalog.
+
+    The analysis fields are None if the song hasn't been analyzed.
+    """
+    __slots__ = CATALOG_FIELDS
+
+    def __init__(
+            self,
+            artist: str,
+            album: str,
+            song_name: str,
+            song_id: int,
+            path: str,
+            loudness: float = None,
+            peak: float = None,
+            duration: float = None,
+            lead_silence: float = None,
+            trail_silence: float = None,
+        ):
+        self.artist = artist
+        self.album = album
+        self.song_name = song_name
+        self.song_id = song_id
+        self.path = path
+        self.loudness = loudness  # LUFS
+        self.peak = peak  # dBFS
+        self.duration = duration  # Seconds
+        self.lead_silence = lead_silence  # Seconds
+        self.trail_silence = trail_silence  # Seconds
+
+    def infos(self) -> tuple:
+        """Return the song, album and artist of the song.
+        """
+        return self.song_name, self.album, self.artist
+
+    def gain(self) -> float:
+        """Linear gain normalizing the loudness of the song.
+        """
+        return normalization_gain(self.loudness, self.peak)
+
+    def trim(self) -> tuple:
+        """Return the (start, end) in seconds of the song without its silences.
+        End is None if the song hasn't been analyzed.
+        """
+        if self.duration is None:
+            return 0, None
+        return self.lead_silence, round(self.duration - self.trail_silence, 3)
+
+
+class Catalog:
+    """Indexes of all songs.
+
+    Songs are indexed by path, and albums map to their tracks
+    already sorted by song_id.
+    """
+    def __init__(self, songs: list):
+        self.songs = songs
+        self.by_path = {song.path: song for song in songs}  # path -> Song
+
+        self.by_album = dict()  # album -> [Song] sorted by song_id
+        for song in songs:
+            self.by_album.setdefault(song.album, []).append(song)
+        for tracks in self.by_album.values():
+            tracks.sort(key=lambda song: song.song_id)
+
+        self.album_names = list(self.by_album.keys())
+        self.album_paths = {
+            album: [song.path for song in tracks]
+            for album, tracks in self.by_album.items()
+        }  # album -> [path] sorted by song_id
+        self.paths = [song.path for song in songs]
+
+    @classmethod
+    def from_csv(cls, csv_path: str):
+        """Load the catalog from the csv file created by `create_csv`.
+        """
+        return cls(read_catalog(csv_path))
+
+    def to_dataframe(self):
+        """Return the catalog as a pandas DataFrame.
+
+        Only meant for analytics tooling, pandas is imported lazily.
+        """
+        import pandas as pd
+        return pd.DataFrame(
+            [[getattr(song, field) for field in CATALOG_FIELDS] for song in self.songs],
+            columns=CATALOG_FIELDS,
+        )
+
+    def __len__(self) -> int:
+        return len(self.songs)
+
+    def __contains__(self, path: str) -> bool:
+        return path in self.by_path
+
+
+def parse_float(value: str) -> float:
+    return float(value) if value else None
+
+
+def read_catalog(csv_path: str) -> list:
+    """Read the songs of the csv database.
+
+    Databases written before the analysis columns were added are read without analysis.
+    """
+    with open(csv_path, newline='') as f:
+        reader = csv.DictReader(f)
+        return [
+            Song(
+                row['artist'],
+                row['album'],
+                row['song_name'],
+                int(row['song_id']),
+                row['path'],
+                *(parse_float(row.get(field)) for field in ANALYSIS_FIELDS),
+            )
+            for row in reader
+        ]
+
+
+def write_catalog(csv_path: str, songs: list):
+    """Write the songs to the csv database.
+
+    The file is replaced atomically so that a running bot never reads a partial database.
+    """
+    tmp_path = csv_path + '.tmp'
+    with open(tmp_path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(CATALOG_FIELDS)
+        for song in songs:
+            writer.writerow([
+                '' if getattr(song, field) is None else getattr(song, field)
+                for field in CATALOG_FIELDS
+            ])
+    os.replace(tmp_path, csv_path)
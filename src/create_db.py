@@ -1,56 +1,191 @@
 """
 Read songs infos from a specified directory.
-Creates a DataFrame into a csv file.
+Writes the songs into a csv file.
+
+The scanned files are remembered in an index file (path, size, mtime, parsed infos
+and analysis), so that an incremental run only parses and analyzes the new or modified files.
+The songs are analyzed (loudness, peak, duration, silences) in a process pool.
 """
 import os
-import pandas as pd
+import json
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from src.analysis import ANALYSIS_FIELDS, analyze
+from src.catalog import Song, write_catalog
+
+
+INDEX_VERSION = 1
+SCAN_WORKERS = 8
+
+
+def parse_filename(filename: str) -> tuple:
+    """Return the song_id and the song_name of a song file.
+    """
+    song_info = filename.split('.mp3')[0]
+    song_info = song_info.split('0')[1]
+    song_info = song_info.split(' ')
+    song_id, song_name = int(song_info[0]), song_info[1:]
+    song_name = ' '.join(song_name)
+    return song_id, song_name
+
+
+def scan_dir(path: str) -> tuple:
+    """List the mp3 files and the subdirectories of the given directory.
+
+    Files are given as (path, size, mtime) tuples.
+    """
+    files, subdirs = [], []
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if entry.is_dir():
+                subdirs.append(entry.path)
+            elif entry.is_file() and entry.name.endswith('.mp3'):
+                stat = entry.stat()
+                files.append((entry.path, stat.st_size, stat.st_mtime_ns))
+    return files, subdirs
+
+
+def scan_library(songs_path: str) -> dict:
+    """Walk the whole library, scanning the directories concurrently.
+
+    Return a dictionnary mapping a file path to its (album, size, mtime).
+    Files at the root of the library belong to the 'EP' album,
+    the others to the album named after their top directory.
+    """
+    library = dict()
+
+    with ThreadPoolExecutor(max_workers=SCAN_WORKERS) as executor:
+        pending = {executor.submit(scan_dir, songs_path): 'EP'}
+        while pending:
+            future, album = pending.popitem()
+            files, subdirs = future.result()
+            for path, size, mtime in files:
+                library[path] = (album, size, mtime)
+
+            for subdir in subdirs:
+                subdir_album = os.path.basename(subdir) if album == 'EP' and \
+                    os.path.dirname(subdir) == songs_path else album
+                pending[executor.submit(scan_dir, subdir)] = subdir_album
+
+    return library
 
 
-def read_dir(path, album, data):
-    for f in os.listdir(path):
-        if os.path.isfile(os.path.join(path, f)) and f.endswith('.mp3'):
-            song_info = f.split('.mp3')[0]
-            song_info = song_info.split('0')[1]
-            song_info = song_info.split(' ')
-            song_id, song_name = int(song_info[0]), song_info[1:]
-            song_name = ' '.join(song_name)
+def load_index(index_path: str) -> dict:
+    """Load the files index.
 
-            data['artist'].append('Tastycool')
-            data['album'].append(album)
-            data['song_name'].append(song_name)
-            data['song_id'].append(song_id)
-            data['path'].append(os.path.join(path, f))
+    Return an empty index if the file doesn't exist or is outdated.
+    """
+    if not os.path.isfile(index_path):
+        return dict()
+
+    with open(index_path) as f:
+        index = json.load(f)
+
+    if index.get('version') != INDEX_VERSION:
+        return dict()
+    return index['files']
+
+
+def save_index(index_path: str, files: dict):
+    """Save the files index.
+    """
+    tmp_path = index_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump({'version': INDEX_VERSION, 'files': files}, f)
+    os.replace(tmp_path, index_path)
+
+
+def analyze_all(paths: list, workers: int = None) -> dict:
+    """Analyze the songs in a process pool.
+
+    Return a dictionnary mapping each path to its analysis (None if it failed).
+    """
+    if not paths:
+        return dict()
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return dict(zip(paths, executor.map(analyze, paths, chunksize=4)))
 
 
-def create_csv(songs_path, csv_path):
+def create_csv(
+        songs_path,
+        csv_path,
+        incremental: bool = False,
+        index_path: str = None,
+        analysis: bool = True,
+    ) -> dict:
     """
     Read all songs from the specified songs_path.
 
     Write the data to a csv file.
+    If incremental is True, only the files that changed since the last run are parsed and analyzed.
+    If analysis is False, the songs are not analyzed.
+
+    Return the number of added, updated, removed and analyzed songs.
     """
-    data = {'artist': [],
-            'album': [],
-            'song_name': [],
-            'song_id': [],
-            'path': []}
-    read_dir(songs_path, 'EP', data)
-    for f in os.listdir(songs_path):
-        if not os.path.isfile(os.path.join(songs_path, f)):
-            read_dir(os.path.join(songs_path, f), f, data)
+    songs_path = songs_path.rstrip('/')
+    index_path = index_path or os.path.splitext(csv_path)[0] + '_index.json'
+    index = load_index(index_path) if incremental else dict()
+    library = scan_library(songs_path)
+    counts = {'added': 0, 'updated': 0, 'removed': 0, 'analyzed': 0}
+
+    files = dict()
+    for path, (album, size, mtime) in library.items():
+        entry = index.get(path)
+        if entry and entry['size'] == size and entry['mtime'] == mtime and entry['album'] == album:
+            files[path] = entry
+            continue
+
+        try:
+            song_id, song_name = parse_filename(os.path.basename(path))
+        except (IndexError, ValueError):
+            print(f'Skipping {path}: unexpected filename.')
+            continue
 
-    df = pd.DataFrame(data=data)
-    df.to_csv(csv_path, index=False)
+        counts['updated' if entry else 'added'] += 1
+        files[path] = {
+            'size': size,
+            'mtime': mtime,
+            'artist': 'Tastycool',
+            'album': album,
+            'song_name': song_name,
+            'song_id': song_id,
+        }
+
+    counts['removed'] = sum(1 for path in index if path not in files)
+
+    # Analyze the new and modified songs, and those whose analysis failed
+    if analysis:
+        pending = [path for path, entry in files.items() if entry.get('loudness') is None]
+        for path, result in analyze_all(pending).items():
+            if result is None:
+                print(f'Could not analyze {path}.')
+                continue
+            files[path].update(result)
+            counts['analyzed'] += 1
+
+    songs = [
+        Song(
+            entry['artist'],
+            entry['album'],
+            entry['song_name'],
+            entry['song_id'],
+            path,
+            *(entry.get(field) for field in ANALYSIS_FIELDS),
+        )
+        for path, entry in sorted(files.items())
+    ]
+    write_catalog(csv_path, songs)
+    save_index(index_path, files)
+    return counts
 
 
 if __name__ == '__main__':
     import sys
 
     if len(sys.argv) < 2:
-        print(f'Usage: {sys.argv[0]} [path_to_songs]')
+        print(f'Usage: {sys.argv[0]} [path_to_songs] [--incremental]')
         sys.exit(0)
 
-    path = sys.argv[1]
-    if path[-1] == '/':
-        path = path[:-1]  # Remove pending '/' if there is one
-
-    create_csv(sys.argv[1], 'songs.csv')
+    counts = create_csv(sys.argv[1], 'songs.csv', incremental='--incremental' in sys.argv)
+    print(counts)
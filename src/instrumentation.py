@@ -0,0 +1,193 @@
+"""Metrics of the bot.
+
+Counters, durations and gauges are kept in memory by the shared `metrics` object.
+They can be read in the Prometheus text format on a local HTTP endpoint,
+or dumped periodically to a JSON file. No external service is needed.
+"""
+import sys
+import json
+import time
+import asyncio
+import traceback
+from contextlib import contextmanager
+
+from discord.ext import tasks
+from discord.ext.commands import Cog, Bot, Context
+
+
+LAG_INTERVAL = 1  # Seconds between two measures of the event loop lag
+LAG_PROBE = 0.1  # Seconds slept to measure the lag
+DUMP_INTERVAL = 30  # Seconds between two JSON dumps
+
+
+class Metrics:
+    """In-memory registry of metrics.
+
+    - counters: monotonic values
+    - durations: count, sum and max of observed durations (in seconds)
+    - gauges: callbacks computing a value when the metrics are read
+    Metrics can have labels given as keyword arguments.
+    """
+    def __init__(self):
+        self.counters = dict()  # (name, labels) -> value
+        self.durations = dict()  # (name, labels) -> [count, sum, max]
+        self.gauges = dict()  # name -> callback
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name: str, duration: float, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        summary = self.durations.setdefault(key, [0, 0.0, 0.0])
+        summary[0] += 1
+        summary[1] += duration
+        summary[2] = max(summary[2], duration)
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        """Observe the duration of the block.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def gauge(self, name: str, callback: callable):
+        """Register a gauge, computed by `callback()` when the metrics are read.
+        """
+        self.gauges[name] = callback
+
+    def snapshot(self) -> dict:
+        """Return all metrics as a JSON serializable dictionnary.
+        """
+        def label_str(labels: tuple) -> str:
+            return ','.join(f'{k}={v}' for k, v in labels)
+
+        snapshot = {'counters': {}, 'durations': {}, 'gauges': {}}
+        for (name, labels), value in self.counters.items():
+            snapshot['counters'].setdefault(name, {})[label_str(labels)] = value
+        for (name, labels), (count, total, maximum) in self.durations.items():
+            snapshot['durations'].setdefault(name, {})[label_str(labels)] = {
+                'count': count,
+                'sum': total,
+                'max': maximum,
+            }
+        for name, callback in self.gauges.items():
+            snapshot['gauges'][name] = callback()
+        return snapshot
+
+    def render_prometheus(self) -> str:
+        """Return all metrics in the Prometheus text format.
+        """
+        def label_str(labels: tuple) -> str:
+            if not labels:
+                return ''
+            return '{' + ','.join(f'{k}="{v}"' for k, v in labels) + '}'
+
+        lines = []
+        for (name, labels), value in sorted(self.counters.items()):
+            lines.append(f'tastybot_{name}_total{label_str(labels)} {value}')
+        for (name, labels), (count, total, maximum) in sorted(self.durations.items()):
+            lines.append(f'tastybot_{name}_seconds_count{label_str(labels)} {count}')
+            lines.append(f'tastybot_{name}_seconds_sum{label_str(labels)} {total}')
+            lines.append(f'tastybot_{name}_seconds_max{label_str(labels)} {maximum}')
+        for name, callback in sorted(self.gauges.items()):
+            lines.append(f'tastybot_{name} {callback()}')
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
+
+
+class Instrumentation(Cog):
+    """Measures the commands latency and the event loop lag,
+    and exposes the metrics.
+
+    The metrics are served on http://host:port/metrics if a port is given,
+    and dumped into json_path if given.
+    """
+    def __init__(self, bot: Bot, host: str = '127.0.0.1', port: int = None, json_path: str = None):
+        self.bot = bot
+        self.host = host
+        self.port = port
+        self.json_path = json_path
+        self.server = None
+        self.measure_lag.start()
+        if json_path is not None:
+            self.dump_json.start()
+        if port is not None:
+            bot.loop.create_task(self.serve())
+
+    def cog_unload(self):
+        self.measure_lag.cancel()
+        self.dump_json.cancel()
+        if self.server is not None:
+            self.server.close()
+
+    @Cog.listener()
+    async def on_command(self, context: Context):
+        context.command_start = time.perf_counter()
+
+    @Cog.listener()
+    async def on_command_completion(self, context: Context):
+        self.observe_command(context, 'ok')
+
+    @Cog.listener()
+    async def on_command_error(self, context: Context, error: Exception):
+        """Registering this listener disables the default `Bot.on_command_error`,
+        so the error is reported here the same way it would have been.
+        """
+        self.observe_command(context, 'error')
+        self.report_error(context, error)
+
+    def report_error(self, context: Context, error: Exception):
+        command = context.command
+        if command is not None and command.has_error_handler():
+            return
+        if context.cog is not None and context.cog.has_error_handler():
+            return
+        print(f'Ignoring exception in command {command}:', file=sys.stderr)
+        traceback.print_exception(type(error), error, error.__traceback__, file=sys.stderr)
+
+    def observe_command(self, context: Context, status: str):
+        start = getattr(context, 'command_start', None)
+        if start is None or context.command is None:
+            return
+        metrics.observe('command', time.perf_counter() - start, command=context.command.name, status=status)
+
+    @tasks.loop(seconds=LAG_INTERVAL)
+    async def measure_lag(self):
+        """The lag is how late the loop wakes up a sleeping coroutine.
+        """
+        start = time.perf_counter()
+        await asyncio.sleep(LAG_PROBE)
+        metrics.observe('event_loop_lag', max(0, time.perf_counter() - start - LAG_PROBE))
+
+    @tasks.loop(seconds=DUMP_INTERVAL)
+    async def dump_json(self):
+        with open(self.json_path, 'w') as f:
+            json.dump(metrics.snapshot(), f, indent=2)
+
+    async def serve(self):
+        self.server = await asyncio.start_server(self.handle_request, self.host, self.port)
+
+    async def handle_request(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Minimal HTTP server answering the metrics to any request.
+        """
+        try:
+            await reader.readuntil(b'\r\n\r\n')
+            body = metrics.render_prometheus().encode()
+            writer.write(
+                b'HTTP/1.1 200 OK\r\n'
+                b'Content-Type: text/plain; version=0.0.4\r\n'
+                + f'Content-Length: {len(body)}\r\n'.encode()
+                + b'Connection: close\r\n\r\n'
+                + body
+            )
+            await writer.drain()
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            pass
+        finally:
+            writer.close()
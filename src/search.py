@@ -0,0 +1,163 @@
+"""Search index over the song and album names of the catalog.
+
+Names are normalized (case, accents and punctuation are ignored) and split into tokens.
+A query token matches a name token exactly, as a prefix, or fuzzily
+when they share enough trigrams, so that typos are forgiven.
+Fuzzy and prefix matching are done on the vocabulary of tokens only,
+which is much smaller than the catalog.
+"""
+import heapq
+import bisect
+import unicodedata
+
+
+EXACT_WEIGHT = 1.0
+PREFIX_WEIGHT = 0.8  # Multiplied by the share of the token covered by the prefix
+FUZZY_WEIGHT = 0.6  # Multiplied by the trigram similarity
+FUZZY_THRESHOLD = 0.4  # Minimum trigram similarity of a fuzzy match
+MAX_EXPANSIONS = 32  # Maximum number of name tokens matched by one query token
+COMMON_RATIO = 4  # A query token matching this many times more names than found so far only scores them
+
+
+def normalize(text: str) -> list:
+    """Split the text into lowercase tokens without accents nor punctuation.
+    """
+    text = unicodedata.normalize('NFKD', text.casefold())
+    text = ''.join(c if c.isalnum() else ' ' for c in text if not unicodedata.combining(c))
+    return text.split()
+
+
+def trigrams(token: str) -> set:
+    padded = f'  {token} '
+    return {padded[i:i+3] for i in range(len(padded) - 2)}
+
+
+class SearchIndex:
+    """Index of a list of names, searched by position in the list.
+    """
+    def __init__(self, names: list):
+        self.names = names
+        self.normalized = []  # Normalized names, used to rank the results
+        postings = dict()  # token -> set of positions
+        for position, name in enumerate(names):
+            tokens = normalize(name)
+            self.normalized.append(' '.join(tokens))
+            for token in tokens:
+                postings.setdefault(token, set()).add(position)
+
+        self.vocabulary = sorted(postings)  # Sorted for prefix lookups
+        self.postings = [postings[token] for token in self.vocabulary]
+        self.token_ids = {token: token_id for token_id, token in enumerate(self.vocabulary)}
+
+        self.trigram_postings = dict()  # trigram -> [token_id]
+        self.trigram_counts = []  # token_id -> number of trigrams
+        for token_id, token in enumerate(self.vocabulary):
+            token_trigrams = trigrams(token)
+            self.trigram_counts.append(len(token_trigrams))
+            for trigram in token_trigrams:
+                self.trigram_postings.setdefault(trigram, []).append(token_id)
+
+    def expand(self, token: str) -> dict:
+        """Return the name tokens matching the query token, with their weight.
+        """
+        matches = dict()  # token_id -> weight
+        token_id = self.token_ids.get(token)
+        if token_id is not None:
+            matches[token_id] = EXACT_WEIGHT
+
+        # Prefix matches
+        start = bisect.bisect_right(self.vocabulary, token)
+        for token_id in range(start, min(start + MAX_EXPANSIONS, len(self.vocabulary))):
+            candidate = self.vocabulary[token_id]
+            if not candidate.startswith(token):
+                break
+            matches[token_id] = PREFIX_WEIGHT * len(token) / len(candidate)
+
+        if matches or len(token) < 3:
+            return matches
+
+        # Fuzzy matches, with the Dice coefficient of the trigrams
+        query_trigrams = trigrams(token)
+        shared = dict()  # token_id -> number of shared trigrams
+        for trigram in query_trigrams:
+            for token_id in self.trigram_postings.get(trigram, ()):
+                shared[token_id] = shared.get(token_id, 0) + 1
+
+        for token_id, count in shared.items():
+            similarity = 2 * count / (len(query_trigrams) + self.trigram_counts[token_id])
+            if similarity >= FUZZY_THRESHOLD:
+                matches[token_id] = FUZZY_WEIGHT * similarity
+
+        if len(matches) > MAX_EXPANSIONS:
+            matches = dict(heapq.nlargest(MAX_EXPANSIONS, matches.items(), key=lambda item: item[1]))
+        return matches
+
+    def search(self, query: str, limit: int = 10) -> list:
+        """Return the positions of the best matching names, best first.
+
+        Names matching more query tokens come first, then the ones with the best matches.
+        """
+        tokens = normalize(query)
+        if not tokens:
+            return []
+
+        # Rarest query tokens first, so that the common ones only score the names already found
+        expansions = []
+        for token in tokens:
+            matches = self.expand(token)
+            expansions.append((sum(len(self.postings[token_id]) for token_id in matches), matches))
+        expansions.sort(key=lambda expansion: expansion[0])
+
+        scores = dict()  # position -> [matched tokens, score]
+        for size, matches in expansions:
+            best = dict()  # position -> best weight for this query token
+            if scores and size > COMMON_RATIO * len(scores):
+                for position in scores:
+                    for token_id, weight in matches.items():
+                        if position in self.postings[token_id] and best.get(position, 0) < weight:
+                            best[position] = weight
+            else:
+                for token_id, weight in matches.items():
+                    for position in self.postings[token_id]:
+                        if best.get(position, 0) < weight:
+                            best[position] = weight
+
+            for position, weight in best.items():
+                score = scores.get(position)
+                if score is None:
+                    scores[position] = [1, weight]
+                else:
+                    score[0] += 1
+                    score[1] += weight
+
+        normalized_query = ' '.join(tokens)
+
+        def rank(position: int) -> tuple:
+            matched, score = scores[position]
+            name = self.normalized[position]
+            if name == normalized_query:
+                score += 1
+            elif name.startswith(normalized_query):
+                score += 0.5
+            return matched, score, -len(name)
+
+        return heapq.nlargest(limit, scores, key=rank)
+
+
+class CatalogSearch:
+    """Search the songs and the albums of a catalog.
+    """
+    def __init__(self, catalog):
+        self.catalog = catalog
+        self.songs = SearchIndex([song.song_name for song in catalog.songs])
+        self.albums = SearchIndex(catalog.album_names)
+
+    def find_songs(self, query: str, limit: int = 10) -> list:
+        """Return the best matching songs.
+        """
+        return [self.catalog.songs[position] for position in self.songs.search(query, limit)]
+
+    def find_albums(self, query: str, limit: int = 10) -> list:
+        """Return the names of the best matching albums.
+        """
+        return [self.catalog.album_names[position] for position in self.albums.search(query, limit)]
@@ -0,0 +1,131 @@
+"""Run the bot as multiple shard processes.
+
+Each process runs the shards it is given, so that the voice work of its guilds
+runs on its own core. A supervisor restarts the crashed processes, and
+aggregates the status and metrics that the processes regularly report
+through a multiprocessing queue.
+"""
+import os
+import json
+import time
+import queue
+import multiprocessing
+
+from discord.ext import tasks
+from discord.ext.commands import Cog, Bot
+
+from src.instrumentation import metrics
+
+
+REPORT_INTERVAL = 10  # Seconds between two status reports of a shard
+RESTART_DELAY = 5  # Minimum seconds between two restarts of a shard
+STATUS_PATH = 'shards.json'
+
+
+class ShardReporter(Cog):
+    """Sends the status and the metrics of this process to the supervisor.
+    """
+    def __init__(self, bot: Bot, shard_id: int, status_queue: multiprocessing.Queue):
+        self.bot = bot
+        self.shard_id = shard_id
+        self.status_queue = status_queue
+        self.report.start()
+
+    def cog_unload(self):
+        self.report.cancel()
+
+    @tasks.loop(seconds=REPORT_INTERVAL)
+    async def report(self):
+        status = {
+            'shard_id': self.shard_id,
+            'pid': os.getpid(),
+            'ready': self.bot.is_ready(),
+            'guilds': len(self.bot.guilds),
+            'latency': self.bot.latency,
+            'metrics': metrics.snapshot(),
+            'time': time.time(),
+        }
+        try:
+            self.status_queue.put_nowait(status)
+        except queue.Full:
+            pass  # The supervisor is late, skip this report
+
+
+def aggregate(statuses: dict) -> dict:
+    """Sum the gauges and the counters reported by all shards.
+    """
+    gauges, counters = dict(), dict()
+    for status in statuses.values():
+        for name, value in status['metrics']['gauges'].items():
+            gauges[name] = gauges.get(name, 0) + value
+        for name, values in status['metrics']['counters'].items():
+            counters[name] = counters.get(name, 0) + sum(values.values())
+
+    return {
+        'shards': len(statuses),
+        'guilds': sum(status['guilds'] for status in statuses.values()),
+        'gauges': gauges,
+        'counters': counters,
+    }
+
+
+def supervise(run_shard: callable, shard_count: int, status_path: str = STATUS_PATH):
+    """Run `run_shard(shard_id, shard_count, status_queue)` in one process per shard.
+
+    Crashed processes are restarted, and the aggregated status is written in status_path.
+    """
+    context = multiprocessing.get_context()
+    status_queue = context.Queue(maxsize=10 * shard_count)
+    processes = dict()  # shard_id -> Process
+    started_at = dict()  # shard_id -> time of the last start
+    statuses = dict()  # shard_id -> last reported status
+    restarts = {shard_id: 0 for shard_id in range(shard_count)}
+
+    def start(shard_id: int):
+        process = context.Process(
+            target=run_shard,
+            args=(shard_id, shard_count, status_queue),
+            name=f'tastybot-shard-{shard_id}',
+        )
+        process.start()
+        processes[shard_id] = process
+        started_at[shard_id] = time.monotonic()
+
+    for shard_id in range(shard_count):
+        start(shard_id)
+
+    last_write = 0
+    try:
+        while True:
+            try:
+                status = status_queue.get(timeout=1)
+                statuses[status['shard_id']] = status
+            except queue.Empty:
+                pass
+
+            for shard_id, process in processes.items():
+                if process.is_alive():
+                    continue
+                if time.monotonic() - started_at[shard_id] < RESTART_DELAY:
+                    continue  # Avoid a restart loop
+
+                print(f'Shard {shard_id} exited with code {process.exitcode}, restarting it.')
+                statuses.pop(shard_id, None)
+                restarts[shard_id] += 1
+                start(shard_id)
+
+            if time.monotonic() - last_write > REPORT_INTERVAL:
+                last_write = time.monotonic()
+                with open(status_path, 'w') as f:
+                    json.dump({
+                        'total': aggregate(statuses),
+                        'restarts': restarts,
+                        'shards': statuses,
+                    }, f, indent=2)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for process in processes.values():
+            process.terminate()
+        for process in processes.values():
+            process.join()
@@ -1,15 +1,31 @@
 import os
+import random
 
 import discord
 from discord.ext.commands import Cog, Bot, Context, command
-from discord import Member
+from discord import Guild, Member, TextChannel
+from discord.abc import GuildChannel
 
 
 class TastyBot(Cog):
     """Basic commands and reaction.
     """
-    def __init__(self, bot: Bot):
+    def __init__(self, bot: Bot, split_token: str = '::'):
         self.bot = bot
+        welcome_msg = os.getenv('WELCOME_MSG')
+        self.welcome_msgs = welcome_msg.split(split_token) if welcome_msg else []
+        self.welcome_channels = dict()  # guild.id -> channel where to send the welcome messages
+
+    def welcome_channel(self, guild: Guild) -> TextChannel:
+        """Return the channel where to welcome new members, or None if there is no text channel.
+        The channel is cached until the channels of the guild change.
+        """
+        if guild.id not in self.welcome_channels:
+            channel = guild.system_channel
+            if channel is None and len(guild.text_channels) > 0:
+                channel = guild.text_channels[0]
+            self.welcome_channels[guild.id] = channel
+        return self.welcome_channels[guild.id]
 
     @Cog.listener()
     async def on_member_join(self, member: Member):
@@ -17,18 +33,34 @@ class TastyBot(Cog):
 
         Sends a little welcoming message randomly choosen.
         """
-        channel = member.guild.system_channel
-        if channel is None and len(member.guild.text_channels) > 0:
-            channel = member.guild.text_channels[0]
+        if not self.welcome_msgs:
+            return
 
-        if channel is None: # No text channels
+        channel = self.welcome_channel(member.guild)
+        if channel is None:  # No text channels
             return
 
-        WELCOME_MSG = os.getenv('WELCOME_MSG')
-        msgs = WELCOME_MSG.split(SPLIT_TOKEN)
-        msg_number = randint(0, len(msgs)-1)
-        msg = msgs[msg_number]
-        await channel.send(msg)
+        await channel.send(random.choice(self.welcome_msgs))
+
+    @Cog.listener()
+    async def on_guild_channel_create(self, channel: GuildChannel):
+        self.welcome_channels.pop(channel.guild.id, None)
+
+    @Cog.listener()
+    async def on_guild_channel_delete(self, channel: GuildChannel):
+        self.welcome_channels.pop(channel.guild.id, None)
+
+    @Cog.listener()
+    async def on_guild_channel_update(self, before: GuildChannel, after: GuildChannel):
+        self.welcome_channels.pop(after.guild.id, None)
+
+    @Cog.listener()
+    async def on_guild_update(self, before: Guild, after: Guild):
+        self.welcome_channels.pop(after.id, None)  # The system channel may have changed
+
+    @Cog.listener()
+    async def on_guild_remove(self, guild: Guild):
+        self.welcome_channels.pop(guild.id, None)
 
     @Cog.listener()
     async def on_ready(self):
@@ -36,39 +68,14 @@ class TastyBot(Cog):
 
         Print debug infos.
         """
+        guilds = self.bot.guilds
+        members = sum(guild.member_count or 0 for guild in guilds)
         print(f'{self.bot.user} has connected to Discord!')
-
-        for guild in self.bot.guilds:
-            print(f'Connected to {guild.name}')
-            members = '\n - '.join([member.name for member in guild.members])
-            print(f'Guild Members:\n - {members}')
-
-            channel = guild.system_channel
-
-            # We do not send anything anymore
-            # if channel is not None and guild.name == 'Insane server':
-                # await channel.send('Heyo ! Be ready for some tasty musics !')
+        print(f'Connected to {len(guilds)} guilds, {members} members in total.')
 
         activity = discord.Activity(type=discord.ActivityType.listening, name='some Tastycool songs')
         await self.bot.change_presence(activity=activity)
 
-    @Cog.listener()
-    async def on_member_join(member: Member):
-        """Sends a little welcoming message randomly choosen.
-        """
-        channel = member.guild.system_channel
-        if not channel and len(member.guild.text_channels) > 0:
-            channel = member.guild.text_channels[0]
-
-        if not channel:
-            return  # No text channel
-
-        WELCOME_MSG = os.getenv('WELCOME_MSG')
-        msgs = WELCOME_MSG.split(SPLIT_TOKEN)
-        msg_number = random.randrange(0, len(msgs))
-        msg = msgs[msg_number]
-        await channel.send(msg)
-
     @Cog.listener()
     async def on_error(self, event, *args, **kwargs):
         """Log 'on_message' errors.
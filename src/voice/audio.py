@@ -0,0 +1,97 @@
+"""Audio sources with the volume applied by FFmpeg.
+
+The gain is set in the FFmpeg filter graph (`-af volume=`) when the source is created,
+so frames are passed through without any work done by the bot.
+If the volume changes while a song is playing, the remaining frames of this song
+are scaled by the bot until the next song starts with the new gain in FFmpeg.
+"""
+import sys
+import array
+
+import discord
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import audioop  # Removed in Python 3.13
+except ImportError:
+    audioop = None
+
+
+def ffmpeg_source(
+        path: str,
+        gain: float = 1,
+        offset: float = 0,
+        options: str = '',
+        duration: float = None,
+    ) -> discord.FFmpegPCMAudio:
+    """Return a FFmpeg source decoding the file with the given gain, starting at offset (s)
+    and lasting at most duration (s).
+    """
+    before_options = f'-ss {offset:.2f}' if offset else None
+    options = f'{options} -af volume={gain:.3f}'.strip()
+    if duration is not None:
+        options += f' -t {max(0, duration):.2f}'
+    return discord.FFmpegPCMAudio(path, before_options=before_options, options=options)
+
+
+def scale_pcm(data: bytes, gain: float) -> bytes:
+    """Scale 16 bits little-endian PCM samples.
+    Uses numpy if available, then audioop, and a much slower pure python loop otherwise.
+    """
+    if np is not None:
+        samples = np.frombuffer(data, dtype='<i2').astype(np.float32)
+        samples *= gain
+        np.clip(samples, -32768, 32767, out=samples)
+        return samples.astype('<i2').tobytes()
+
+    if audioop is not None and sys.byteorder == 'little':
+        return audioop.mul(data, 2, gain)  # Clips the samples
+
+    samples = array.array('h', data)
+    if sys.byteorder == 'big':
+        samples.byteswap()
+    scaled = array.array('h', (max(-32768, min(32767, int(s * gain))) for s in samples))
+    if sys.byteorder == 'big':
+        scaled.byteswap()
+    return scaled.tobytes()
+
+
+class VolumeSource(discord.AudioSource):
+    """Wraps a PCM source whose volume has been applied by FFmpeg.
+
+    Frames are passed through as long as the volume doesn't change.
+    """
+    def __init__(self, original: discord.AudioSource, volume: float = 1):
+        self.original = original
+        self.baked_volume = volume  # Volume applied by FFmpeg
+        self.gain = 1  # Extra gain applied to the frames
+
+    @property
+    def volume(self) -> float:
+        return self.baked_volume * self.gain
+
+    @property
+    def scalable(self) -> bool:
+        """Whether the volume can be changed, silenced frames can't be scaled back up.
+        """
+        return self.baked_volume != 0
+
+    def set_volume(self, volume: float):
+        if self.scalable:
+            self.gain = volume / self.baked_volume
+
+    def read(self) -> bytes:
+        data = self.original.read()
+        if self.gain == 1 or not data:
+            return data
+        return scale_pcm(data, self.gain)
+
+    def is_opus(self) -> bool:
+        return False
+
+    def cleanup(self):
+        self.original.cleanup()
@@ -0,0 +1,215 @@
+"""On-disk cache of frequently played Youtube songs.
+
+Songs played at least `threshold` times are downloaded in background
+and then played from the local file instead of being streamed.
+The cache is bounded in size, the least recently used songs are evicted first.
+Files are moved into the cache atomically and the index, play counts included,
+is saved on disk after each download and periodically (see `save`),
+so that the cache survives restarts.
+"""
+import os
+import json
+import time
+import asyncio
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+
+MAX_PLAYS_TRACKED = 10000  # Play counts kept for the songs not cached yet
+RETRY_DELAY = 600  # Seconds before retrying a failed download, doubled at each failure
+MAX_RETRY_DELAY = 24 * 3600
+
+
+class DownloadCache:
+    """LRU cache of downloaded songs, keyed by video ID.
+
+    `downloader(url, directory)` downloads the song into the directory
+    and returns the path of the file. It is run in a dedicated thread pool.
+    The cache is used by one process only, if `cache_dir` is None it is opened later
+    (see `open`), once the directory of the process is known.
+    """
+    def __init__(
+            self,
+            cache_dir: str,
+            downloader: callable,
+            max_bytes: int = 2 * 2**30,
+            threshold: int = 3,
+            workers: int = 2,
+        ):
+        self.downloader = downloader
+        self.max_bytes = max_bytes
+        self.threshold = threshold
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='download')
+        self.in_flight = dict()  # video_id -> Task
+        self.dirty = False  # Whether the index has changed since it was saved
+        self.save_lock = None  # asyncio.Lock serializing the saves, created on the event loop
+        self.failures = dict()  # video_id -> (failed downloads, time.monotonic() of the next retry)
+        self.cache_dir = self.index_path = None
+        self.entries = dict()  # video_id -> {'file', 'size', 'last_used'}
+        self.plays = dict()  # video_id -> number of plays
+        if cache_dir is not None:
+            self.open(cache_dir)
+
+    def open(self, cache_dir: str):
+        """Use the songs cached in the directory.
+        """
+        self.cache_dir = cache_dir
+        self.index_path = os.path.join(cache_dir, 'index.json')
+        self.entries = dict()
+        self.plays = dict()
+        os.makedirs(cache_dir, exist_ok=True)
+        self.load_index()
+
+    def load_index(self):
+        if not os.path.isfile(self.index_path):
+            return
+
+        with open(self.index_path) as f:
+            index = json.load(f)
+
+        # Forget the files that have been removed meanwhile
+        self.entries = {
+            video_id: entry for video_id, entry in index['entries'].items()
+            if os.path.isfile(os.path.join(self.cache_dir, entry['file']))
+        }
+        self.plays = index['plays']
+
+    def index(self) -> dict:
+        """Copy of the index, that can be written from another thread.
+        """
+        return {
+            'entries': {video_id: dict(entry) for video_id, entry in self.entries.items()},
+            'plays': dict(self.plays),
+        }
+
+    def save_index(self, index: dict = None):
+        """Write the index, by default the current one.
+        """
+        index = index if index is not None else self.index()
+        tmp_path = self.index_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(index, f)
+        os.replace(tmp_path, self.index_path)
+
+    async def save(self):
+        """Write the index from a thread if it has changed since the last save.
+        """
+        if self.save_lock is None:
+            self.save_lock = asyncio.Lock()
+        async with self.save_lock:
+            if not self.dirty:
+                return
+            self.dirty = False
+            try:
+                await asyncio.get_event_loop().run_in_executor(None, self.save_index, self.index())
+            except OSError:
+                self.dirty = True
+                raise
+
+    def size(self) -> int:
+        return sum(entry['size'] for entry in self.entries.values())
+
+    def get(self, video_id: str) -> str:
+        """Return the path of the cached song, or None if it isn't cached.
+        """
+        entry = self.entries.get(video_id)
+        if entry is None:
+            return None
+
+        path = os.path.join(self.cache_dir, entry['file'])
+        if not os.path.isfile(path):
+            del self.entries[video_id]
+            return None
+
+        entry['last_used'] = time.time()
+        self.dirty = True
+        return path
+
+    def record_play(self, video_id: str, url: str):
+        """Count a play of the song, and download it in background if it is played often.
+        """
+        plays = self.plays.pop(video_id, 0) + 1
+        self.plays[video_id] = plays  # Most recently played last
+        self.dirty = True
+        while len(self.plays) > MAX_PLAYS_TRACKED:
+            del self.plays[next(iter(self.plays))]
+
+        if plays < self.threshold or video_id in self.entries or video_id in self.in_flight:
+            return
+        failures = self.failures.get(video_id)
+        if failures is not None and time.monotonic() < failures[1]:
+            return  # Failed recently
+
+        task = asyncio.ensure_future(self.download(video_id, url))
+        task.add_done_callback(lambda task: self.download_done(video_id, task))
+        self.in_flight[video_id] = task
+
+    def download_done(self, video_id: str, task: asyncio.Future):
+        """Report a failed background download, and delay its next retry.
+        """
+        if task.cancelled():
+            return
+
+        error = task.exception()
+        if error is None:
+            self.failures.pop(video_id, None)
+            return
+
+        count = self.failures.pop(video_id, (0, 0))[0] + 1
+        delay = min(MAX_RETRY_DELAY, RETRY_DELAY * 2 ** (count - 1))
+        self.failures[video_id] = (count, time.monotonic() + delay)
+        while len(self.failures) > MAX_PLAYS_TRACKED:
+            del self.failures[next(iter(self.failures))]
+        print(f'Failed to download {video_id} ({count} failures), retrying in {delay} s: {error}')
+
+    async def fetch(self, video_id: str, url: str) -> str:
+        """Return the path of the song, downloading it now if it isn't cached.
+        """
+        path = self.get(video_id)
+        if path is not None:
+            return path
+
+        if video_id not in self.in_flight:
+            self.in_flight[video_id] = asyncio.ensure_future(self.download(video_id, url))
+        return await asyncio.shield(self.in_flight[video_id])
+
+    async def download(self, video_id: str, url: str) -> str:
+        """Download the song into the cache and return its path.
+        """
+        loop = asyncio.get_event_loop()
+        try:
+            with tempfile.TemporaryDirectory(dir=self.cache_dir) as tmp_dir:
+                tmp_path = await loop.run_in_executor(self.executor, self.downloader, url, tmp_dir)
+                filename = video_id + os.path.splitext(tmp_path)[1]
+                path = os.path.join(self.cache_dir, filename)
+                os.replace(tmp_path, path)  # Atomic, the file is never seen partially written
+        finally:
+            del self.in_flight[video_id]
+
+        self.entries[video_id] = {
+            'file': filename,
+            'size': os.path.getsize(path),
+            'last_used': time.time(),
+        }
+        self.evict(keep=video_id)
+        self.dirty = True
+        await self.save()
+        return path
+
+    def evict(self, keep: str = None):
+        """Remove the least recently used songs until the cache fits in max_bytes.
+        The `keep` song is never removed.
+        """
+        size = self.size()
+        for video_id, entry in sorted(self.entries.items(), key=lambda item: item[1]['last_used']):
+            if size <= self.max_bytes:
+                break
+            if video_id == keep:
+                continue
+
+            size -= entry['size']
+            del self.entries[video_id]
+            try:
+                os.remove(os.path.join(self.cache_dir, entry['file']))
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,127 @@
+"""Gapless playback of consecutive songs.
+
+A guild playing an album keeps one audio source for the voice client,
+which reads the songs one after the other. The next song is resolved ahead
+(its FFmpeg process is already decoding) and staged into the source,
+so the first frame of the next song directly follows the last frame of the current one,
+without waiting for the player to stop and for the event loop to start the next song.
+"""
+import time
+import threading
+
+import discord
+
+from src.instrumentation import metrics
+
+
+class GaplessSource(discord.AudioSource):
+    """Source chaining the songs staged by the event loop.
+
+    `on_track_change(entry, infos)` is called from the audio thread
+    when the staged song starts.
+    As long as the current and the staged songs are all Opus, their packets are
+    passed through. Otherwise, Opus songs are decoded so that all songs
+    are chained in the same PCM stream.
+    """
+    def __init__(self, source: discord.AudioSource, entry, on_track_change: callable):
+        self.lock = threading.Lock()
+        self.on_track_change = on_track_change
+        self.current, self.entry = source, entry
+        self.decoder = None  # Decoder of the current song, if it is Opus and not passed through
+        self.staged = None  # (entry, source, infos) of the next song
+        self.passthrough = source.is_opus()  # Whether the frames read are Opus packets
+        self.skip_requested = False
+        self.closed = False
+        self.tracks = 1  # Number of songs played by this source
+
+    @property
+    def original(self) -> discord.AudioSource:
+        return self.current
+
+    def owns(self, entry) -> bool:
+        """Whether the entry is being played or staged.
+        """
+        return entry is self.entry or (self.staged is not None and self.staged[0] is entry)
+
+    def stage(self, entry, source: discord.AudioSource, infos: str):
+        """Set the song played when the current one ends.
+        """
+        with self.lock:
+            if not self.closed:
+                self.staged = (entry, source, infos)
+                return
+        source.cleanup()  # The player has already stopped
+
+    def unstage(self) -> discord.AudioSource:
+        """Remove the staged song, and return its source to clean up (or None).
+        """
+        with self.lock:
+            staged, self.staged = self.staged, None
+        return staged[1] if staged is not None else None
+
+    def skip(self) -> bool:
+        """Go to the staged song at the next frame.
+        Return False if there isn't any staged song.
+        """
+        with self.lock:
+            if self.staged is None:
+                return False
+            self.skip_requested = True
+            return True
+
+    def update_passthrough(self):
+        """Pass the packets through if the current and the staged songs are all Opus,
+        decode the current song otherwise.
+        Called with the lock held, before reading a frame.
+        """
+        staged = self.staged
+        self.passthrough = self.current.is_opus() and (staged is None or staged[1].is_opus())
+        if self.passthrough or not self.current.is_opus():
+            self.decoder = None
+        elif self.decoder is None:
+            self.decoder = discord.opus.Decoder()
+
+    def read_current(self) -> bytes:
+        data = self.current.read()
+        if self.decoder is not None and data:
+            return self.decoder.decode(data)
+        return data
+
+    def read(self) -> bytes:
+        with self.lock:
+            self.update_passthrough()
+        data = b'' if self.skip_requested else self.read_current()
+        if data:
+            return data
+
+        # The current song is over, go on with the staged one
+        start = time.perf_counter()
+        with self.lock:
+            self.skip_requested = False
+            if self.staged is None:
+                return b''  # Stops the player
+            previous = self.current
+            entry, self.current, infos = self.staged
+            self.entry, self.staged = entry, None
+            self.decoder = None
+            self.update_passthrough()
+            self.tracks += 1
+
+        previous.cleanup()
+        self.on_track_change(entry, infos)
+        data = self.read_current()
+        metrics.observe('track_gap', time.perf_counter() - start, mode='gapless')
+        return data
+
+    def is_opus(self) -> bool:
+        """Format of the last frame read, the player asks after each read.
+        """
+        return self.passthrough
+
+    def cleanup(self):
+        with self.lock:
+            self.closed = True
+        self.current.cleanup()
+        staged = self.unstage()
+        if staged is not None:
+            staged.cleanup()
@@ -0,0 +1,99 @@
+"""Stream audio files served over HTTP, like a file server of the local network.
+
+FFmpeg reads the files directly from their URL, so nothing has to be resolved ahead.
+Only the files under the root URL of the file server can be streamed, so that
+the users cannot make the bot fetch any other URL (local services, metrics...).
+"""
+import os
+import posixpath
+from urllib.parse import unquote, urlparse
+
+from discord.ext.commands import Cog, Bot, Context, command
+
+from src.voice.audio import VolumeSource, ffmpeg_source
+from src.voice.providers import SourceProvider
+from src.voice.voice_manager import VoiceManager
+
+
+HTTP_VOLUME = 0.5
+
+
+def is_http_url(url: str) -> bool:
+    parsed = urlparse(url)
+    return parsed.scheme in ('http', 'https') and bool(parsed.netloc)
+
+
+def is_under_root(url: str, root: str) -> bool:
+    """Whether the URL is a file served under the root URL.
+    """
+    parsed, parsed_root = urlparse(url), urlparse(root)
+    if (parsed.scheme, parsed.netloc) != (parsed_root.scheme, parsed_root.netloc):
+        return False
+    path = posixpath.normpath(unquote(parsed.path) or '/')
+    root_path = posixpath.normpath(unquote(parsed_root.path) or '/').rstrip('/') + '/'
+    return path.startswith(root_path)
+
+
+def file_title(url: str) -> str:
+    """Return the name of the file without its extension, or the URL if there is none.
+    """
+    name = os.path.splitext(os.path.basename(unquote(urlparse(url).path)))[0]
+    return name or url
+
+
+class HttpFileProvider(SourceProvider):
+    """Audio files referenced by their HTTP URL.
+    """
+    kind = 'http'
+
+    def __init__(self, root: str):
+        self.root = root
+
+    async def resolve(self, url: str, offset: float = 0, volume: float = 1) -> tuple:
+        if self.root is None or not is_under_root(url, self.root):
+            raise ValueError(f'{url} is not served under the file server root')
+        source = ffmpeg_source(url, HTTP_VOLUME * volume, offset, options='-vn')
+        return VolumeSource(source, volume), file_title(url)
+
+
+class HttpFiles(Cog):
+    """Commands to listen to audio files served over HTTP.
+
+    The files are served under the `root` URL, streaming is disabled if it is None.
+    """
+    def __init__(self, bot: Bot, voice_manager: VoiceManager, root: str = None):
+        self.bot = bot
+        self.root = root
+        self.voice_manager = voice_manager
+        self.voice_manager.register_provider(HttpFileProvider(root))
+
+    @command(name='stream')
+    async def http_stream(self, context: Context, url: str):
+        """Add to the playlist the audio file at the given HTTP URL.
+
+        You have to be connected to a voice channel.
+        """
+        if self.root is None:
+            await context.send('No file server is configured.')
+            return
+
+        if not is_http_url(url):
+            await context.send('This is not an HTTP URL.')
+            return
+
+        if not is_under_root(url, self.root):
+            await context.send(f'Only the files under {self.root} can be streamed.')
+            return
+
+        if not await self.voice_manager.connect(context):
+            return  # Connexion to voice client failed
+
+        guild_id = context.guild.id
+        title = file_title(url)
+        self.voice_manager.add_to_playlist(context, 'http', url, title=title)
+
+        if not self.voice_manager.is_playing(guild_id):
+            await self.voice_manager.play_next(guild_id)
+        else:
+            self.voice_manager.outbox.post(
+                context.channel.id, f'Added to playlist: {title}', key='added', merge=True)
@@ -0,0 +1,136 @@
+"""On-disk cache of pre-encoded Opus songs.
+
+Songs of the catalog are transcoded once, at a fixed volume normalized by their
+analyzed loudness and without their leading and trailing silences, by a batch job.
+Cached songs are then streamed to discord as is, without any decoding,
+volume scaling nor encoding done by the bot.
+Songs missing from the cache, or played at another volume, fall back to the PCM path
+with the volume applied by FFmpeg.
+
+Requirements: ffmpeg with libopus
+"""
+import os
+import hashlib
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+
+import discord
+
+from src.catalog import Catalog, Song
+from src.voice.audio import VolumeSource, ffmpeg_source
+
+
+CACHE_DIR = 'opus_cache'
+CACHE_VOLUME = 0.3
+OPUS_BITRATE = 128  # kbps
+
+
+def cache_path(song: Song, cache_dir: str = CACHE_DIR) -> str:
+    """Return the cache file of the given song.
+
+    The key depends on the size and mtime of the song, and on its analysis,
+    so a modified song never hits an outdated cache file.
+    """
+    stat = os.stat(song.path)
+    start, end = song.trim()
+    key = f'{os.path.abspath(song.path)}:{stat.st_size}:{stat.st_mtime_ns}:{CACHE_VOLUME}:{OPUS_BITRATE}:' \
+          f'{song.gain():.3f}:{start}:{end}'
+    key = hashlib.sha1(key.encode()).hexdigest()
+    return os.path.join(cache_dir, f'{key}.opus')
+
+
+def cached_path(song: Song, cache_dir: str = CACHE_DIR) -> str:
+    """Return the cache file of the song if it exists, None otherwise.
+    """
+    try:
+        opus_path = cache_path(song, cache_dir)
+    except FileNotFoundError:
+        return None
+    return opus_path if os.path.isfile(opus_path) else None
+
+
+def trim_options(start: float, end: float) -> tuple:
+    """Return the FFmpeg input and output options keeping the song between start and end (s).
+    """
+    input_options = ['-ss', f'{start:.3f}'] if start else []
+    output_options = ['-t', f'{end - start:.3f}'] if end is not None else []
+    return input_options, output_options
+
+
+def transcode(path: str, opus_path: str, gain: float = 1, start: float = 0, end: float = None) -> bool:
+    """Encode the song between start and end (s) into an Opus file,
+    at the cache volume multiplied by the gain.
+
+    Return True if the transcoding succeeded.
+    """
+    tmp_path = opus_path + '.tmp'
+    input_options, output_options = trim_options(start, end)
+    process = subprocess.run(
+        [
+            'ffmpeg', '-nostdin', '-loglevel', 'error', '-y',
+            *input_options, '-i', path, '-vn', *output_options,
+            '-af', f'volume={CACHE_VOLUME * gain:.3f}',
+            '-c:a', 'libopus', '-b:a', f'{OPUS_BITRATE}k', '-ar', '48000', '-ac', '2',
+            '-f', 'opus', tmp_path,
+        ],
+        stdout=subprocess.DEVNULL,
+    )
+    if process.returncode != 0:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return False
+
+    os.replace(tmp_path, opus_path)
+    return True
+
+
+def build_cache(csv_path: str, cache_dir: str = CACHE_DIR, workers: int = None) -> dict:
+    """Transcode all songs of the catalog that are not cached yet.
+
+    Return the number of cached, transcoded and failed songs.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    catalog = Catalog.from_csv(csv_path)
+    counts = {'cached': 0, 'transcoded': 0, 'failed': 0}
+
+    jobs = []
+    for song in catalog.songs:
+        try:
+            opus_path = cache_path(song, cache_dir)
+        except FileNotFoundError:
+            counts['failed'] += 1
+            continue
+
+        if os.path.isfile(opus_path):
+            counts['cached'] += 1
+        else:
+            jobs.append((song.path, opus_path, song.gain(), *song.trim()))
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for success in executor.map(transcode, *zip(*jobs)) if jobs else []:
+            counts['transcoded' if success else 'failed'] += 1
+
+    return counts
+
+
+def audio_source(song: Song, volume: float = 1, offset: float = 0) -> discord.AudioSource:
+    """Return the audio source of the song, starting at offset (s) after its leading silence.
+
+    The volume is relative to the cache volume, and the song is normalized by its analyzed gain.
+    Cached songs at the default volume are passed through, the others are decoded by FFmpeg.
+    """
+    opus_path = cached_path(song)
+    if opus_path is not None and volume == 1:
+        before_options = f'-ss {offset:.2f}' if offset else None
+        return discord.FFmpegOpusAudio(opus_path, codec='copy', before_options=before_options)
+
+    if opus_path is not None:  # Already normalized and trimmed
+        return VolumeSource(ffmpeg_source(opus_path, volume, offset), volume)
+
+    start, end = song.trim()
+    return VolumeSource(ffmpeg_source(
+        song.path,
+        CACHE_VOLUME * song.gain() * volume,
+        start + offset,
+        duration=end - start - offset if end is not None else None,
+    ), volume)
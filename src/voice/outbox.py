@@ -0,0 +1,155 @@
+"""Outbound messages of the voice cogs, sent off the playback path.
+
+Messages are queued per channel and sent by a background task, so that the
+coroutines starting the songs never wait for Discord. Sends are spaced out
+to stay within the rate limits of the channels and of the bot.
+Rapid updates are coalesced: a status message waiting in the queue is replaced
+by the newer one, and the status message already sent is edited instead of
+posting a new one, as long as it is still the last message of the channel.
+"""
+import time
+import asyncio
+import itertools
+from collections import OrderedDict
+
+import discord
+from discord.ext.commands import Bot
+
+
+CHANNEL_RATE = 1  # Messages per second in a channel, on average
+CHANNEL_BURST = 5  # Messages sent at once in a channel
+GLOBAL_RATE = 40  # Messages per second of the bot, across all channels
+MAX_LENGTH = 2000  # Maximum length of a Discord message
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self) -> float:
+        """Seconds to wait before a token is available.
+        """
+        self.refill()
+        return max(0, (1 - self.tokens) / self.rate)
+
+    def take(self):
+        self.refill()
+        self.tokens -= 1
+
+
+class ChannelOutbox:
+    """Messages waiting to be sent in a channel.
+    """
+    def __init__(self):
+        self.pending = OrderedDict()  # key -> (content, merged)
+        self.status = dict()  # key -> last message sent with this key
+        self.last_message_id = None  # Last message seen in the channel
+        self.bucket = TokenBucket(CHANNEL_RATE, CHANNEL_BURST)
+        self.task = None
+        self.last_active = time.monotonic()
+
+
+class Outbox:
+    """Sends the messages in the background, in the order they are posted.
+    """
+    def __init__(self, bot: Bot):
+        self.bot = bot
+        self.channels = dict()  # channel.id -> ChannelOutbox
+        self.bucket = TokenBucket(GLOBAL_RATE, GLOBAL_RATE)
+        self.unique_keys = itertools.count()
+
+    def post(self, channel_id: int, content: str, key: str = None, merge: bool = False):
+        """Queue a message, without waiting for it to be sent.
+
+        Messages with a key are coalesced: a message waiting with the same key is replaced
+        (or extended by the new content if merge), and if not merged, the last message sent
+        with this key is edited if nothing has been posted in the channel since.
+        """
+        outbox = self.channels.get(channel_id)
+        if outbox is None:
+            outbox = self.channels[channel_id] = ChannelOutbox()
+        outbox.last_active = time.monotonic()
+
+        if key is None:
+            key = next(self.unique_keys)
+        pending = outbox.pending.get(key)
+        if merge and pending is not None and len(pending[0]) + len(content) < MAX_LENGTH:
+            content = f'{pending[0]}\n{content}'
+        elif merge and pending is not None:  # Too long, the merged message is sent first
+            outbox.pending[next(self.unique_keys)] = outbox.pending.pop(key)
+        outbox.pending[key] = (content[:MAX_LENGTH], merge)
+
+        if outbox.task is None:
+            outbox.task = self.bot.loop.create_task(self.flush(channel_id, outbox))
+
+    def seen(self, message: discord.Message):
+        """Keep track of the last message of the channel.
+        """
+        outbox = self.channels.get(message.channel.id)
+        if outbox is not None:
+            outbox.last_message_id = message.id
+
+    def evict_idle(self, timeout: float) -> int:
+        """Forget the channels where nothing has been posted for `timeout` seconds,
+        along with their status messages.
+
+        Return the number of channels forgotten.
+        """
+        now = time.monotonic()
+        idle = [
+            channel_id for channel_id, outbox in self.channels.items()
+            if not outbox.pending and outbox.task is None and now - outbox.last_active > timeout
+        ]
+        for channel_id in idle:
+            del self.channels[channel_id]
+        return len(idle)
+
+    async def flush(self, channel_id: int, outbox: ChannelOutbox):
+        """Send the pending messages of the channel.
+        """
+        try:
+            while outbox.pending:
+                delay = max(outbox.bucket.delay(), self.bucket.delay())
+                while delay > 0:
+                    await asyncio.sleep(delay)
+                    delay = max(outbox.bucket.delay(), self.bucket.delay())
+                outbox.bucket.take()
+                self.bucket.take()
+
+                key, (content, merged) = outbox.pending.popitem(last=False)
+                channel = self.bot.get_channel(channel_id)
+                if channel is None:  # The channel has been deleted
+                    outbox.pending.clear()
+                    break
+                await self.send(channel, outbox, key if isinstance(key, str) and not merged else None, content)
+        finally:
+            outbox.task = None
+            outbox.last_active = time.monotonic()
+
+    async def send(self, channel: discord.abc.Messageable, outbox: ChannelOutbox, key: str, content: str):
+        """Send the message, or edit the status message of the key if it is still the last one.
+        """
+        status = outbox.status.get(key)
+        try:
+            if status is not None and status.id == outbox.last_message_id:
+                try:
+                    await status.edit(content=content)
+                    return
+                except discord.NotFound:  # The status message has been deleted, a new one is sent
+                    del outbox.status[key]
+
+            message = await channel.send(content)
+            if message is not None:
+                outbox.last_message_id = message.id
+                if key is not None:
+                    outbox.status[key] = message
+        except discord.HTTPException as e:
+            print(f'Failed to send a message in channel {channel.id}: {e}')
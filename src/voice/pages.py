@@ -0,0 +1,109 @@
+"""Paginated messages.
+
+Long listings are split into pages that fit in a discord embed.
+Users browse the pages with reactions, and only the page being viewed is rendered.
+"""
+import math
+import asyncio
+from itertools import islice
+
+import discord
+from discord.ext.commands import Bot, Context
+
+from src.voice.playlist import Playlist
+
+
+PAGE_LENGTH = 1900  # Discord messages are limited to 2000 characters
+QUEUE_PAGE_SIZE = 10  # Songs per page
+PAGINATION_TIMEOUT = 120  # In seconds
+PREVIOUS_PAGE = '◀️'
+NEXT_PAGE = '▶️'
+
+
+def split_pages(lines: list, max_length: int = PAGE_LENGTH) -> list:
+    """Join the lines into pages of at most max_length characters.
+    """
+    pages, page, length = [], [], 0
+    for line in lines:
+        if page and length + len(line) + 1 > max_length:
+            pages.append('\n'.join(page))
+            page, length = [], 0
+        page.append(line)
+        length += len(line) + 1
+
+    if page:
+        pages.append('\n'.join(page))
+    return pages
+
+
+def catalog_lines(catalog) -> list:
+    """Format the catalog as a listing of the albums and their songs.
+    """
+    lines = []
+    for album_name, songs in catalog.by_album.items():
+        lines.append(f'{album_name}:')
+        for song_id, song in enumerate(songs):
+            lines.append(f'\t{song_id+1}. {song.song_name}')
+        lines.append('')
+    return lines
+
+
+def queue_page_count(playlist: Playlist) -> int:
+    return max(1, math.ceil(len(playlist) / QUEUE_PAGE_SIZE))
+
+
+def render_queue_page(playlist: Playlist, page: int, currently_playing: str = None) -> str:
+    """Format one page of the playlist.
+    Only the songs of the page are read.
+    """
+    start = page * QUEUE_PAGE_SIZE
+    lines = [f'Now playing: {currently_playing}', ''] if currently_playing else []
+    for position, entry in enumerate(islice(playlist, start, start + QUEUE_PAGE_SIZE), start=start+1):
+        lines.append(f'{position}. {entry.title or "Unknown song"}')
+
+    if len(lines) == 0:
+        lines.append('The playlist is empty.')
+    return '\n'.join(lines)
+
+
+def page_embed(title: str, description: str, page: int, page_count: int) -> discord.Embed:
+    embed = discord.Embed(title=title, description=description)
+    if page_count > 1:
+        embed.set_footer(text=f'Page {page+1}/{page_count}')
+    return embed
+
+
+async def send_pages(bot: Bot, context: Context, title: str, page_count: callable, render_page: callable):
+    """Send the first page and let the users browse the others with reactions.
+
+    `page_count()` returns the current number of pages and
+    `render_page(page)` the description of a page.
+    """
+    page = 0
+    count = page_count()
+    message = await context.send(embed=page_embed(title, render_page(page), page, count))
+    if count <= 1:
+        return
+
+    await message.add_reaction(PREVIOUS_PAGE)
+    await message.add_reaction(NEXT_PAGE)
+
+    def check(reaction: discord.Reaction, user: discord.User) -> bool:
+        return reaction.message.id == message.id and user != bot.user and \
+            str(reaction.emoji) in (PREVIOUS_PAGE, NEXT_PAGE)
+
+    while True:
+        try:
+            reaction, user = await bot.wait_for('reaction_add', timeout=PAGINATION_TIMEOUT, check=check)
+        except asyncio.TimeoutError:
+            return
+
+        count = page_count()
+        step = 1 if str(reaction.emoji) == NEXT_PAGE else -1
+        page = (page + step) % count
+        await message.edit(embed=page_embed(title, render_page(page), page, count))
+
+        try:
+            await message.remove_reaction(reaction, user)
+        except discord.Forbidden:
+            pass  # Missing the manage messages permission
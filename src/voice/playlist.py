@@ -0,0 +1,109 @@
+"""Queue of songs of a guild.
+
+Entries only keep the IDs of the channel and of the requester, the provider
+and the reference of the song (see `src.voice.providers`), and the title to display.
+Their source, the (kind, reference) pair, can be stored and resolved again after a restart.
+"""
+import random
+from collections import deque
+from itertools import islice
+
+
+class QueueEntry:
+    """A song waiting in the playlist.
+    """
+    __slots__ = ('channel_id', 'requester_id', 'provider', 'reference', 'title', 'offset')
+
+    def __init__(
+            self,
+            channel_id: int,
+            requester_id: int,
+            provider,
+            reference: str,
+            title: str = None,
+            offset: float = 0,
+        ):
+        self.channel_id = channel_id
+        self.requester_id = requester_id
+        self.provider = provider
+        self.reference = reference
+        self.title = title
+        self.offset = offset  # Position (s) where the song starts
+
+    @property
+    def source(self) -> tuple:
+        return self.provider.kind, self.reference
+
+    def resolve(self, **kwargs):
+        """Return the coroutine resolving the audio source of the song.
+        """
+        return self.provider.resolve(self.reference, offset=self.offset, **kwargs)
+
+    def to_dict(self) -> dict:
+        """Serializable form of the entry, without the song reference.
+        """
+        return {
+            'channel_id': self.channel_id,
+            'requester_id': self.requester_id,
+            'title': self.title,
+            'source': self.source,
+        }
+
+
+class Playlist:
+    """FIFO of QueueEntry, with O(1) push and pop.
+
+    Positions used by the editing methods start at 0 for the next song.
+    """
+    def __init__(self):
+        self.entries = deque()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __bool__(self) -> bool:
+        return len(self.entries) > 0
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def __getitem__(self, position: int) -> QueueEntry:
+        return self.entries[position]
+
+    def append(self, entry: QueueEntry):
+        self.entries.append(entry)
+
+    def popleft(self) -> QueueEntry:
+        return self.entries.popleft()
+
+    def clear(self):
+        self.entries.clear()
+
+    def head(self, n: int) -> list:
+        """Return the next n entries.
+        """
+        return list(islice(self.entries, n))
+
+    def remove(self, position: int) -> QueueEntry:
+        """Remove and return the entry at the given position.
+        """
+        entry = self.entries[position]
+        del self.entries[position]
+        return entry
+
+    def move(self, position: int, new_position: int):
+        """Move the entry at position to new_position.
+        """
+        entry = self.remove(position)
+        self.entries.insert(new_position, entry)
+
+    def shuffle(self):
+        entries = list(self.entries)
+        random.shuffle(entries)
+        self.entries = deque(entries)
+
+    def skipto(self, position: int):
+        """Drop all entries before the given position.
+        """
+        for _ in range(position):
+            self.entries.popleft()
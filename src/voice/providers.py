@@ -0,0 +1,58 @@
+"""Providers of audio sources.
+
+Songs are referenced by a (kind, reference) pair, where the reference is a string
+(a path, an URL...) that can be stored and resolved again after a restart.
+Each kind of song has a provider, registered into the VoiceManager, that resolves
+the references into audio sources and tells how they should be scheduled.
+"""
+import asyncio
+from abc import ABC, abstractmethod
+
+
+class SourceProvider(ABC):
+    """Resolves the songs of one kind.
+
+    Capabilities, used by the VoiceManager to schedule the resolutions:
+    - expensive: resolving needs network round trips, so the songs are warmed up
+      with `resolve_batch` long before being played
+    - cacheable: `cache_key` identifies a song across guilds, so a song is warmed up
+      once for all guilds
+    - batch_size: maximum number of songs given at once to `resolve_batch`
+    - supports_radio: `radio` draws endlessly songs of this kind, for the radio mode
+    """
+    kind = None
+    expensive = False
+    cacheable = False
+    batch_size = 1
+    supports_radio = False
+
+    @abstractmethod
+    async def resolve(self, reference: str, offset: float = 0, volume: float = 1) -> tuple:
+        """Return the audio source of the song starting at offset (s), and its infos.
+        """
+
+    async def prefetch(self, reference: str):
+        """Warm up the caches of the provider so that the song is resolved quickly later.
+        """
+        pass
+
+    async def resolve_batch(self, references: list):
+        """Warm up several songs at once.
+        """
+        await asyncio.gather(*(self.prefetch(reference) for reference in references))
+
+    def played(self, reference: str):
+        """Called when the song starts playing.
+        """
+        pass
+
+    def radio(self):
+        """Return an endless iterator of songs of this kind, as (reference, title),
+        or None if the provider doesn't support the radio mode.
+        """
+        return None
+
+    def cache_key(self, reference: str) -> str:
+        """Identify the song, whatever the form of its reference.
+        """
+        return reference
@@ -0,0 +1,104 @@
+"""Endless random selection of songs.
+
+Songs are drawn one at a time, so that nothing is queued up front:
+drawing a song costs O(log n) and the memory used by a guild doesn't
+depend on the size of the library.
+The last songs played in a guild are kept in a fixed size ring buffer,
+and they are not drawn again until they leave it.
+"""
+import array
+import bisect
+import random
+import itertools
+
+
+HISTORY_SIZE = 200  # Songs of a guild that are not repeated
+MAX_DRAWS = 20  # Draws before accepting a song recently played
+
+
+class PlayHistory:
+    """Ring buffer of the hashes of the last played songs.
+    """
+    def __init__(self, size: int = HISTORY_SIZE):
+        self.hashes = array.array('q', [0] * size)
+        self.counts = dict()  # hash -> occurrences in the buffer
+        self.size = size
+        self.position = 0
+        self.length = 0
+
+    def __contains__(self, path: str) -> bool:
+        return hash(path) in self.counts
+
+    def __len__(self) -> int:
+        return self.length
+
+    def add(self, path: str):
+        if self.length == self.size:  # Forget the oldest song
+            oldest = self.hashes[self.position]
+            self.counts[oldest] -= 1
+            if self.counts[oldest] == 0:
+                del self.counts[oldest]
+        else:
+            self.length += 1
+
+        path_hash = hash(path)
+        self.hashes[self.position] = path_hash
+        self.counts[path_hash] = self.counts.get(path_hash, 0) + 1
+        self.position = (self.position + 1) % self.size
+
+
+class Radio:
+    """Draws songs of the catalog at random, according to their weight.
+
+    - album_weights: weight of the songs of each album (1 by default)
+    - balance_albums: each album is as likely to be drawn as the others, whatever its length
+    - novelty: songs played n times are (n+1)**novelty less likely to be drawn (0 to ignore the plays)
+    """
+    def __init__(
+            self,
+            catalog,
+            album_weights: dict = None,
+            balance_albums: bool = False,
+            novelty: float = 0,
+            plays: dict = None,
+        ):
+        self.catalog = catalog
+        self.novelty = novelty
+        self.plays = plays if plays is not None else dict()  # path -> number of plays
+
+        album_weights = album_weights or dict()
+        weights = []
+        for song in catalog.songs:
+            weight = album_weights.get(song.album, 1)
+            if balance_albums:
+                weight /= len(catalog.by_album[song.album])
+            weights.append(weight)
+        self.cumulative_weights = list(itertools.accumulate(weights))
+
+    def new_history(self) -> PlayHistory:
+        """Return an empty history for a guild, small enough for the catalog to be drawn from.
+        """
+        return PlayHistory(max(1, min(HISTORY_SIZE, len(self.catalog) // 2)))
+
+    def draw(self):
+        """Return a random song, according to the weights only.
+        """
+        total = self.cumulative_weights[-1]
+        position = bisect.bisect_right(self.cumulative_weights, random.random() * total)
+        return self.catalog.songs[min(position, len(self.catalog.songs) - 1)]
+
+    def pick(self, history: PlayHistory):
+        """Return a random song that is not in the history, and add it to the history.
+
+        The history may not be avoided if the catalog is too small.
+        """
+        for _ in range(MAX_DRAWS):
+            song = self.draw()
+            if song.path in history:
+                continue
+            if self.novelty and random.random() > (1 + self.plays.get(song.path, 0)) ** -self.novelty:
+                continue
+            break
+
+        history.add(song.path)
+        return song
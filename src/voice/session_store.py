@@ -0,0 +1,90 @@
+"""Persistent storage of the guild sessions.
+
+A session is what is needed to resume a guild after a restart:
+its voice channel, the song being played with its elapsed time, and the playlist.
+Songs are stored as (kind, reference) sources that the cogs know how to resolve again.
+"""
+import json
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+
+
+class SessionStore(ABC):
+    """Interface of a session store.
+
+    Sessions are dictionnaries that can be serialized in JSON.
+    """
+    @abstractmethod
+    def save(self, sessions: dict):
+        """Save the sessions (guild.id -> session) in one batch.
+        A None session deletes the stored one.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def save_offsets(self, offsets: dict):
+        """Update the elapsed time of the current songs (guild.id -> offset in seconds).
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def load_all(self) -> dict:
+        """Return all stored sessions (guild.id -> session).
+        """
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class SQLiteSessionStore(SessionStore):
+    """Store the sessions in a local SQLite database.
+
+    Can be used from any thread, writes are serialized by a lock.
+    """
+    def __init__(self, db_path: str = 'sessions.db'):
+        self.db = sqlite3.connect(db_path, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock, self.db:
+            self.db.execute(
+                'CREATE TABLE IF NOT EXISTS sessions ('
+                'guild_id INTEGER PRIMARY KEY, '
+                'data TEXT NOT NULL, '
+                'offset REAL NOT NULL DEFAULT 0)'
+            )
+
+    def save(self, sessions: dict):
+        deleted = [(guild_id,) for guild_id, session in sessions.items() if session is None]
+        saved = [
+            (guild_id, json.dumps(session), session.get('offset', 0))
+            for guild_id, session in sessions.items() if session is not None
+        ]
+        with self.lock, self.db:
+            self.db.executemany('DELETE FROM sessions WHERE guild_id = ?', deleted)
+            self.db.executemany(
+                'INSERT OR REPLACE INTO sessions (guild_id, data, offset) VALUES (?, ?, ?)',
+                saved,
+            )
+
+    def save_offsets(self, offsets: dict):
+        with self.lock, self.db:
+            self.db.executemany(
+                'UPDATE sessions SET offset = ? WHERE guild_id = ?',
+                [(offset, guild_id) for guild_id, offset in offsets.items()],
+            )
+
+    def load_all(self) -> dict:
+        with self.lock:
+            rows = self.db.execute('SELECT guild_id, data, offset FROM sessions').fetchall()
+
+        sessions = dict()
+        for guild_id, data, offset in rows:
+            session = json.loads(data)
+            session['offset'] = offset
+            sessions[guild_id] = session
+        return sessions
+
+    def close(self):
+        with self.lock:
+            self.db.close()
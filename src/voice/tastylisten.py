@@ -1,66 +1,134 @@
 import os
+import time
 import typing
 import random
 import asyncio
 
 import discord
-from discord.ext.commands import Cog, Bot, Context, command
-
-import pandas as pd
+from discord.ext import tasks
+from discord.ext.commands import Cog, Bot, Context, command, is_owner
 
+from src.catalog import Catalog, Song
+from src.search import CatalogSearch
+from src.instrumentation import metrics
+from src.voice import opus_cache
+from src.voice.pages import PAGE_LENGTH, catalog_lines, send_pages, split_pages
+from src.voice.providers import SourceProvider
+from src.voice.radio import Radio
 from src.voice.voice_manager import VoiceManager
 
 
+SEARCH_ALBUMS = 3  # Number of albums listed by !search
+SEARCH_SONGS = 10  # Number of songs listed by !search
+
+
 class HandleSongs:
     """All specific functions to manipulate songs.
+
+    The catalog can be reloaded while the bot is running.
+    A new catalog and its search index are built off the event loop and then swapped
+    in one assignment, so the methods never see a partially built catalog.
     """
-    def __init__(self):
-        self.df_music = pd.read_csv('songs.csv', sep=',')
+    def __init__(self, csv_path: str = 'songs.csv'):
+        self.csv_path = csv_path
+        self.catalog_mtime = os.stat(csv_path).st_mtime_ns
+        self.catalog, self.search = load_catalog(csv_path)
+        self.last_reload_duration = None  # In seconds
+        self.radio_options = {
+            'balance_albums': os.getenv('RADIO_BALANCE_ALBUMS', '0') == '1',
+            'novelty': float(os.getenv('RADIO_NOVELTY', 0)),
+        }
+        self.plays = dict()  # path -> number of plays, kept across reloads
+        self.cached_radio = None
+
+    def csv_mtime(self) -> int:
+        """Modification time of the csv file, None if it is missing.
+        """
+        try:
+            return os.stat(self.csv_path).st_mtime_ns
+        except FileNotFoundError:  # The file is being replaced
+            return None
+
+    def catalog_changed(self) -> bool:
+        """Whether the csv file has been modified since the last load.
+        """
+        mtime = self.csv_mtime()
+        return mtime is not None and mtime != self.catalog_mtime
+
+    async def reload(self, loop: asyncio.AbstractEventLoop) -> float:
+        """Load the csv file again and swap the catalog.
+
+        Return the duration of the reload.
+        """
+        start = time.perf_counter()
+        mtime = os.stat(self.csv_path).st_mtime_ns
+        catalog, search = await loop.run_in_executor(None, load_catalog, self.csv_path)
+        self.catalog, self.search, self.catalog_mtime = catalog, search, mtime
+        self.last_reload_duration = time.perf_counter() - start
+        metrics.observe('catalog_reload', self.last_reload_duration)
+        return self.last_reload_duration
 
     def album_playlist(self, album_name: str) -> list:
         """
         Return the playlist for the given album.
         """
-        if not album_name in self.df_music['album'].values:
+        album_paths = self.catalog.album_paths
+        if album_name not in album_paths:
             return None
-        album = self.df_music[ self.df_music['album'] == album_name ]
-        album = album.sort_values(by='song_id')
-        return list(album['path'].values)
+        return list(album_paths[album_name])
 
-    def random_song(self) -> str:
-        """Return a path to a random song.
+    def find_album(self, query: str) -> str:
+        """Return the album named by the query, or the closest one.
+        Return None if no album matches.
         """
-        path_id = random.randrange(0, len(self.df_music))
-        return self.df_music['path'].values[path_id]
+        if query in self.catalog.album_paths:
+            return query
+        albums = self.search.find_albums(query, limit=1)
+        return albums[0] if albums else None
 
-    def random_playlist(self) -> list:
-        """Return a random playlist containing all songs in the df_music.
+    def radio(self) -> Radio:
+        """Return the radio drawing the songs of the current catalog.
         """
-        return list(self.df_music['path'].sample(frac=1).values)
+        if self.cached_radio is None or self.cached_radio.catalog is not self.catalog:
+            self.cached_radio = Radio(self.catalog, plays=self.plays, **self.radio_options)
+        return self.cached_radio
+
+    def record_play(self, path: str):
+        self.plays[path] = self.plays.get(path, 0) + 1
 
     def random_album(self) -> list:
         """Return a playlist containing a random album.
         """
-        albums = self.df_music.groupby('album')
-        album_id = random.randrange(0, len(albums))
-        album_name = list(albums.groups.keys())[album_id]
+        album_name = random.choice(self.catalog.album_names)
         return self.album_playlist(album_name), album_name
 
+    def song(self, path: str) -> Song:
+        """Return the song of the path.
+
+        The song may have been removed from the catalog since it was queued,
+        it is then returned without its infos nor its analysis.
+        """
+        song = self.catalog.by_path.get(path)
+        if song is None:
+            song = Song('Tastycool', 'Unknown album', os.path.splitext(os.path.basename(path))[0], 0, path)
+        return song
+
     def infos(self, path: str) -> tuple:
         """Return the song, album and artist of the song path.
         """
-        df_music = self.df_music
-        song = df_music[ df_music['path'] == path ]['song_name'].values[0]
-        album = df_music[ df_music['path'] == path ]['album'].values[0]
-        artist = df_music[ df_music['path'] == path ]['artist'].values[0]
-
-        return song, album, artist
+        return self.song(path).infos()
 
     def albums(self) -> dict:
         """Dictionnary mapping an album with its songs (path).
         """
-        albums = list(self.df_music['album'].unique())
-        return {a: self.album_playlist(a) for a in albums}
+        return self.catalog.album_paths
+
+
+def load_catalog(csv_path: str) -> tuple:
+    """Load the catalog and build its search index.
+    """
+    catalog = Catalog.from_csv(csv_path)
+    return catalog, CatalogSearch(catalog)
 
 
 class TastyListen(Cog):
@@ -70,11 +138,49 @@ class TastyListen(Cog):
         self.bot = bot
         self.song_handler = HandleSongs()
         self.voice_manager = voice_manager
+        self.cached_pages = None  # (catalog, pages)
+        self.voice_manager.register_provider(CatalogProvider(self.song_handler))
+        self.watch_catalog.start()
+
+    def cog_unload(self):
+        self.watch_catalog.cancel()
+
+    @tasks.loop(seconds=30)
+    async def watch_catalog(self):
+        """Reload the catalog when the csv file changes.
+
+        The previous catalog is kept if the file can't be loaded,
+        and the reload is tried again at the next change.
+        """
+        if self.song_handler.catalog_changed():
+            mtime = self.song_handler.csv_mtime()
+            try:
+                duration = await self.song_handler.reload(self.bot.loop)
+            except Exception as e:  # Half-written or malformed file
+                self.song_handler.catalog_mtime = mtime  # Not tried again until the file changes
+                print(f'Failed to reload the catalog: {e}')
+                return
+            print(f'Catalog reloaded in {duration*1000:.1f} ms.')
+
+    @watch_catalog.before_loop
+    async def before_watch_catalog(self):
+        await self.bot.wait_until_ready()
+
+    @command(name='reload', hidden=True)
+    @is_owner()
+    async def tastyreload(self, context: Context):
+        """Reload the songs catalog.
+        """
+        duration = await self.song_handler.reload(self.bot.loop)
+        catalog = self.song_handler.catalog
+        await context.send(f'Catalog reloaded in {duration*1000:.1f} ms: '
+                           f'{len(catalog)} songs, {len(catalog.album_names)} albums.')
 
     @command(name='music')
     async def tastymusic(self, context: Context):
-        """Listen to a random playlist of Tastycool Songs.
+        """Listen to an endless radio of Tastycool Songs.
 
+        Recently played songs are not repeated.
         You have to be connected to a voice channel.
         """
         if not await self.voice_manager.connect(context):
@@ -82,10 +188,7 @@ class TastyListen(Cog):
 
         guild_id = context.guild.id
         self.voice_manager.empty_playlist(guild_id)
-
-        for path in self.song_handler.random_playlist():
-            self.voice_manager.add_to_playlist(context, get_audiosource, [path, self.song_handler])
-
+        self.voice_manager.start_radio(context, 'catalog')
         await self.voice_manager.play_next(guild_id)
 
     @command(name='album')
@@ -97,6 +200,7 @@ class TastyListen(Cog):
         """Listen to a tasty album.
 
         If no arguments are given, a random album is being played.
+        The tracks are chained without gaps.
         You have to be connected to a voice channel.
         """
         if not await self.voice_manager.connect(context):
@@ -105,43 +209,130 @@ class TastyListen(Cog):
         guild_id = context.guild.id
 
         if album_name:
-            album_name = ' '.join(album_name)
-            playlist = self.song_handler.album_playlist(album_name)
-            if not playlist:  # Album not found
-                await context.send(f'Album {album_name} not found.')
+            query = ' '.join(album_name)
+            album_name = self.song_handler.find_album(query)
+            if album_name is None:  # Album not found
+                await context.send(f'Album {query} not found.')
                 return
+            playlist = self.song_handler.album_playlist(album_name)
+            if album_name != query:
+                await context.send(f'Playing {album_name}.')
         else:
             playlist, album_name = self.song_handler.random_album()
             await context.send(f'Playing {album_name}.')
 
-        self.voice_manager.empty_playlist(guild_id)
+        self.voice_manager.empty_playlist(guild_id, gapless=True)
         for path in playlist:
-            self.voice_manager.add_to_playlist(context, get_audiosource, [path, self.song_handler])
+            self.voice_manager.add_to_playlist(context, 'catalog', path,
+                                               title=' - '.join(self.song_handler.infos(path)))
 
         await self.voice_manager.play_next(guild_id)
 
+    @command(name='song')
+    async def tastysong(self, context: Context, *, query: str):
+        """Add to the playlist the song best matching the query.
+
+        You have to be connected to a voice channel.
+        """
+        songs = self.song_handler.search.find_songs(query, limit=1)
+        if not songs:
+            await context.send(f'Song {query} not found.')
+            return
+
+        if not await self.voice_manager.connect(context):
+            return  # Connexion to voice client failed
+
+        guild_id = context.guild.id
+        path = songs[0].path
+        info = ' - '.join(self.song_handler.infos(path))
+        self.voice_manager.add_to_playlist(context, 'catalog', path, title=info)
+
+        if not self.voice_manager.is_playing(guild_id):
+            await self.voice_manager.play_next(guild_id)
+        else:
+            self.voice_manager.outbox.post(
+                context.channel.id, f'Added to playlist: {info}', key='added', merge=True)
+
+    @command(name='search')
+    async def tastysearch(self, context: Context, *, query: str):
+        """Search the songs and albums matching the query.
+        """
+        search = self.song_handler.search
+        albums = search.find_albums(query, limit=SEARCH_ALBUMS)
+        songs = search.find_songs(query, limit=SEARCH_SONGS)
+        if not albums and not songs:
+            await context.send(f'Nothing found for {query}.')
+            return
+
+        lines = []
+        if albums:
+            lines.append('Albums:')
+            lines.extend(f'\t{album}' for album in albums)
+        if songs:
+            lines.append('Songs:')
+            lines.extend(f'\t{song.song_name} - {song.album}' for song in songs)
+        text = '\n'.join(lines)
+        await context.send(f'```\n{text[:PAGE_LENGTH]}\n```')
+
     @command()
     async def tastycool(self, context: Context):
         """List the songs that I have in my bag.
         """
-        desc = '```\n'
+        pages = self.catalog_pages()
+        await send_pages(self.bot, context, 'Tastycool songs', lambda: len(pages), lambda page: pages[page])
 
-        for album_name, paths in self.song_handler.albums().items():
-            desc += f'{album_name}:\n'
-            for song_id, path in enumerate(paths):
-                song_name, _, _ = self.song_handler.infos(path)
-                desc += f'\t{song_id+1}. {song_name}\n'
-            desc += '\n'
-
-        desc += '```'
-        await context.send(desc)  # Remove the last '\n'
+    def catalog_pages(self) -> list:
+        """Return the pages listing the catalog.
+        They are formatted once per catalog version.
+        """
+        catalog = self.song_handler.catalog
+        if self.cached_pages is None or self.cached_pages[0] is not catalog:
+            lines = catalog_lines(catalog)
+            pages = [f'```\n{page}\n```' for page in split_pages(lines, PAGE_LENGTH - 8)]
+            self.cached_pages = (catalog, pages)
+        return self.cached_pages[1]
 
 
-async def get_audiosource(path: str, song_handler: HandleSongs) -> tuple[discord.FFmpegPCMAudio, str]:
+async def get_audiosource(
+        path: str,
+        song_handler: HandleSongs,
+        offset: float = 0,
+        volume: float = 1,
+    ) -> tuple[discord.AudioSource, str]:
     """Read the file and return the corresponding audio source.
+
+    Uses the pre-encoded Opus file if the song is cached.
     """
-    audio_source = discord.FFmpegPCMAudio(path)
-    audio_source = discord.PCMVolumeTransformer(audio_source, 0.3)
-    infos = song_handler.infos(path)
-    infos = ' - '.join(infos)
+    with metrics.timer('audiosource', source='catalog'):
+        audio_source = opus_cache.audio_source(song_handler.song(path), volume=volume, offset=offset)
+    infos = ' - '.join(song_handler.infos(path))
     return audio_source, infos
+
+
+class CatalogProvider(SourceProvider):
+    """Songs of the catalog, referenced by their path.
+
+    Local files are cheap to resolve, so they are never warmed up.
+    """
+    kind = 'catalog'
+    cacheable = True
+    supports_radio = True
+
+    def __init__(self, song_handler: HandleSongs):
+        self.song_handler = song_handler
+
+    async def resolve(self, path: str, offset: float = 0, volume: float = 1) -> tuple:
+        return await get_audiosource(path, self.song_handler, offset, volume)
+
+    def played(self, path: str):
+        self.song_handler.record_play(path)
+
+    def radio(self):
+        """Yield endlessly random songs, as (path, title).
+
+        The songs are drawn from the catalog loaded when they are drawn.
+        """
+        history = self.song_handler.radio().new_history()
+        while True:
+            path = self.song_handler.radio().pick(history).path
+            yield path, ' - '.join(self.song_handler.infos(path))
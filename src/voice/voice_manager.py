@@ -1,11 +1,46 @@
 """Manage voice activity of the bot.
 It can connect to a voice channel and stop the music.
 """
+import time
 import asyncio
+from collections import OrderedDict
 
 import discord
+from discord.ext import tasks
 from discord.ext.commands import Cog, Bot, Context, command
 
+from src.instrumentation import metrics
+from src.voice.audio import VolumeSource
+from src.voice.gapless import GaplessSource
+from src.voice.outbox import Outbox
+from src.voice.pages import queue_page_count, render_queue_page, send_pages
+from src.voice.playlist import Playlist, QueueEntry
+from src.voice.providers import SourceProvider
+from src.voice.session_store import SessionStore
+
+
+FLUSH_INTERVAL = 10  # Seconds between two writes of the sessions
+RESUME_STAGGER = 2  # Seconds between two resumed sessions
+REAPER_INTERVAL = 60  # Seconds between two checks of the idle sessions
+RADIO_QUEUED = 3  # Songs of the radio kept in the playlist
+WARMUP_DEPTH = 5  # Songs of the playlist warmed up ahead, for the expensive providers
+WARMUP_TTL = 600  # Seconds before a warmed up song is warmed up again
+MAX_WARMED = 4096  # Warmed up songs remembered
+
+
+class ReaperPolicy:
+    """When to reclaim the ressources of a guild (all timeouts in seconds).
+
+    - alone_timeout: disconnect when nobody else is in the voice channel
+    - idle_timeout: disconnect when nothing is being played (paused or stopped)
+    - evict_timeout: forget the GuildState of a disconnected guild,
+      and the outbox of a channel where nothing has been posted
+    """
+    def __init__(self, alone_timeout: float = 300, idle_timeout: float = 600, evict_timeout: float = 3600):
+        self.alone_timeout = alone_timeout
+        self.idle_timeout = idle_timeout
+        self.evict_timeout = evict_timeout
+
 
 class GuildState:
     """Contains all informations about a
@@ -16,7 +51,21 @@ class GuildState:
         self.guild_id = guild_id
         self.voice_client = None
         self.currently_playing = None
-        self.playlist = list()
+        self.current_entry = None
+        self.started_at = None  # time.monotonic() when the current song started
+        self.start_offset = 0  # Position (s) in the current song when it started
+        self.volume = 1  # Relative to the default volume of the songs
+        self.playlist = Playlist()
+        self.prefetched = list()  # [(playlist entry, task resolving its audio source)]
+        self.gapless = False  # Whether the songs are chained without gaps
+        self.radio = None  # Iterator of the QueueEntry played once the playlist is over
+        self.radio_origin = None  # (kind, channel.id, requester.id) of the radio, to resume it
+        self.feeder = None  # GaplessSource being played in gapless mode
+        self.ended_at = None  # time.perf_counter() when the last song ended
+        self.starting = False  # Whether play_next is resolving the next song
+        self.last_active = time.monotonic()
+        self.alone_since = None
+        self.idle_since = None
 
     async def reset(self):
         """Disconnect from the voice channel if possible,
@@ -25,7 +74,13 @@ class GuildState:
         await self.disconnect()
         self.voice_client = None
         self.currently_playing = None
-        self.playlist = []
+        self.current_entry = None
+        self.gapless = False
+        self.feeder = None
+        self.radio = None
+        self.radio_origin = None
+        self.playlist.clear()
+        self.cancel_prefetch()
 
     async def disconnect(self):
         """Disconnect if possible.
@@ -35,11 +90,147 @@ class GuildState:
 
         self.voice_client = None
 
-    def cleanup_source(self):
+    def refill(self):
+        """Draw songs from the radio until RADIO_QUEUED songs are waiting.
+        """
+        while self.radio is not None and len(self.playlist) < RADIO_QUEUED:
+            self.playlist.append(next(self.radio))
+
+    def elapsed(self) -> float:
+        """Position in seconds in the current song.
+        """
+        if self.started_at is None:
+            return 0
+        return self.start_offset + time.monotonic() - self.started_at
+
+    def snapshot(self) -> dict:
+        """Return the session to store, or None if there is nothing to resume.
+        """
+        if self.voice_client is None or (self.current_entry is None and not self.playlist):
+            return None
+
+        current = self.current_entry
+        return {
+            'voice_channel_id': self.voice_client.channel.id,
+            'current': current.to_dict() if current else None,
+            'offset': self.elapsed(),
+            'volume': self.volume,
+            'queue': [entry.to_dict() for entry in self.playlist],
+            'radio': self.radio_origin if self.radio is not None else None,
+        }
+
+    def cleanup_source(self) -> bool:
         """Make sure FFmpeg process is cleaned up.
+
+        Return True if the process was still alive after the cleanup and had to be killed.
         """
         if self.voice_client and self.voice_client.source:
-            self.voice_client.source.cleanup()
+            source = self.voice_client.source
+            process = ffmpeg_process(source)
+            source.cleanup()
+            if process is not None and process.poll() is None:
+                process.kill()
+                return True
+        return False
+
+    def prefetch(self, depth: int):
+        """Resolve in background the audio sources of the next `depth` songs.
+
+        Prefetched songs that are no longer at the head of the playlist are discarded.
+        In gapless mode, the next song is staged into the feeder once resolved.
+        """
+        head = self.playlist.head(depth)
+        feeder = self.feeder
+        if feeder is not None and feeder.staged is not None and (not head or head[0] is not feeder.staged[0]):
+            discard_source(feeder.unstage())
+
+        kept = []
+        for entry, task in self.prefetched:
+            if any(entry is e for e in head):
+                kept.append((entry, task))
+            else:
+                discard_prefetched(task)
+        self.prefetched = kept
+
+        for entry in head:
+            if feeder is not None and feeder.owns(entry):
+                continue  # Already resolved and given to the feeder
+            if not any(entry is e for e, _ in self.prefetched):
+                self.prefetched.append((entry, asyncio.ensure_future(entry.resolve(volume=self.volume))))
+
+        self.stage_next()
+
+    def stage_next(self):
+        """Give the resolved next song to the feeder, so that it is played without gap.
+        """
+        feeder = self.feeder
+        if feeder is None or feeder.staged is not None or not self.playlist:
+            return
+
+        entry = self.playlist[0]
+        if feeder.owns(entry):
+            return
+        task = next((task for e, task in self.prefetched if e is entry), None)
+        if task is None:
+            return
+        if not task.done():
+            task.add_done_callback(lambda _: self.stage_next())
+            return
+        if task.cancelled() or task.exception() is not None:
+            return  # Played without gapless, after the feeder stops
+
+        self.pop_prefetched(entry)
+        audio_source, infos = task.result()
+        feeder.stage(entry, audio_source, infos)
+
+    def pop_prefetched(self, entry: QueueEntry) -> asyncio.Future:
+        """Return the task resolving the given playlist entry, or None if it wasn't prefetched.
+        """
+        for i, (e, task) in enumerate(self.prefetched):
+            if e is entry:
+                del self.prefetched[i]
+                return task
+        return None
+
+    def cancel_prefetch(self):
+        """Discard all prefetched audio sources.
+        """
+        for _, task in self.prefetched:
+            discard_prefetched(task)
+        self.prefetched = []
+        if self.feeder is not None:
+            discard_source(self.feeder.unstage())
+
+
+def ffmpeg_process(source: discord.AudioSource):
+    """Return the FFmpeg process behind the audio source, if any.
+    """
+    while hasattr(source, 'original'):  # Volume wrappers
+        source = source.original
+    return getattr(source, '_process', None)
+
+
+def report_warm_up(task: asyncio.Future):
+    if not task.cancelled() and task.exception() is not None:
+        print(f'Failed to warm up songs: {task.exception()}')
+
+
+def discard_source(source: discord.AudioSource):
+    if source is not None:
+        source.cleanup()
+
+
+def discard_prefetched(task: asyncio.Future):
+    """Cancel the prefetching task, and clean up its audio source
+    if it has already been resolved.
+    """
+    def cleanup(task: asyncio.Future):
+        if not task.cancelled() and task.exception() is None:
+            audio_source, _ = task.result()
+            audio_source.cleanup()
+
+    task.cancel()
+    task.add_done_callback(cleanup)
 
 
 class VoiceManager(Cog):
@@ -51,9 +242,254 @@ class VoiceManager(Cog):
     different guilds at the same time).
     It also make sure that all ressources are cleaned up.
     """
-    def __init__(self, bot: Bot):
+    def __init__(
+            self,
+            bot: Bot,
+            prefetch_depth: int = 1,
+            store: SessionStore = None,
+            reaper_policy: ReaperPolicy = None,
+        ):
         self.bot = bot
         self.guild_states = dict()  # guild.id -> GuildState
+        self.prefetch_depth = prefetch_depth  # Number of songs resolved ahead
+        self.outbox = Outbox(bot)  # Messages sent in background
+        self.providers = dict()  # kind -> SourceProvider
+        self.warmed = OrderedDict()  # (kind, cache key) -> time.monotonic() of the last warm up
+        self.warm_up_pending = set()  # guild.id of the warm ups scheduled
+
+        # Idle sessions reaper
+        self.reaper_policy = reaper_policy or ReaperPolicy()
+        self.reaper_stats = {
+            'sessions_reclaimed': 0,
+            'states_evicted': 0,
+            'processes_killed': 0,
+            'outboxes_evicted': 0,
+        }
+        self.reap_sessions.start()
+
+        # Sessions persistence
+        self.store = store
+        self.dirty = set()  # guild.id of the sessions to write
+        self.resumed = False
+        if store is not None:
+            self.flush_sessions.start()
+
+        # Metrics
+        metrics.gauge('voice_sessions', lambda: sum(
+            1 for gs in self.guild_states.values()
+            if gs.voice_client is not None and gs.voice_client.is_connected()
+        ))
+        metrics.gauge('queued_tracks', lambda: sum(len(gs.playlist) for gs in self.guild_states.values()))
+        metrics.gauge('ffmpeg_processes', self.count_ffmpeg_processes)
+        metrics.gauge('guild_states', lambda: len(self.guild_states))
+        for name in self.reaper_stats:
+            metrics.gauge(f'reaper_{name}', lambda name=name: self.reaper_stats[name])
+
+    def cog_unload(self):
+        self.reap_sessions.cancel()
+        if self.store is not None:
+            self.flush_sessions.cancel()
+
+    def count_ffmpeg_processes(self) -> int:
+        """Number of live FFmpeg processes, prefetched songs included.
+        """
+        sources = [
+            gs.voice_client.source for gs in self.guild_states.values()
+            if gs.voice_client is not None and gs.voice_client.source is not None
+        ]
+        sources.extend(
+            task.result()[0] for gs in self.guild_states.values() for _, task in gs.prefetched
+            if task.done() and not task.cancelled() and task.exception() is None
+        )
+        sources.extend(
+            gs.feeder.staged[1] for gs in self.guild_states.values()
+            if gs.feeder is not None and gs.feeder.staged is not None
+        )
+        processes = [ffmpeg_process(source) for source in sources]
+        return sum(1 for process in processes if process is not None and process.poll() is None)
+
+    @tasks.loop(seconds=REAPER_INTERVAL)
+    async def reap_sessions(self):
+        """Disconnect the sessions left alone or idle for too long,
+        and forget the guilds that have been disconnected for long
+        and the outboxes of the channels left silent for long.
+        """
+        policy = self.reaper_policy
+        now = time.monotonic()
+
+        for guild_id, gs in list(self.guild_states.items()):
+            if gs.voice_client is None:
+                if not gs.playlist and now - gs.last_active > policy.evict_timeout:
+                    del self.guild_states[guild_id]
+                    self.reaper_stats['states_evicted'] += 1
+                continue
+
+            alone = all(member.bot for member in gs.voice_client.channel.members)
+            idle = not gs.voice_client.is_playing()
+            if not alone:
+                gs.alone_since = None
+            elif gs.alone_since is None:
+                gs.alone_since = now
+            if not idle:
+                gs.idle_since = None
+            elif gs.idle_since is None:
+                gs.idle_since = now
+
+            if (gs.alone_since is not None and now - gs.alone_since > policy.alone_timeout) or \
+                    (gs.idle_since is not None and now - gs.idle_since > policy.idle_timeout):
+                if gs.cleanup_source():
+                    self.reaper_stats['processes_killed'] += 1
+                await self.reset(guild_id)
+                gs.alone_since = gs.idle_since = None
+                self.reaper_stats['sessions_reclaimed'] += 1
+
+        self.reaper_stats['outboxes_evicted'] += self.outbox.evict_idle(policy.evict_timeout)
+
+    @reap_sessions.before_loop
+    async def before_reap_sessions(self):
+        await self.bot.wait_until_ready()
+
+    def register_provider(self, provider: SourceProvider):
+        """Register how to resolve the songs of the provider's kind.
+        """
+        self.providers[provider.kind] = provider
+
+    def schedule(self, gs: GuildState):
+        """Resolve the next songs of the guild, and warm up the following ones.
+
+        The warm up is delayed to the next iteration of the event loop,
+        so that the songs added at once are warmed up in batches.
+        """
+        gs.prefetch(self.prefetch_depth)
+        if gs.guild_id not in self.warm_up_pending:
+            self.warm_up_pending.add(gs.guild_id)
+            self.bot.loop.call_soon(self.warm_up, gs)
+
+    def warm_up(self, gs: GuildState):
+        """Warm up in batches the songs of expensive providers coming after the prefetched ones.
+        A song is warmed up once for all guilds.
+        """
+        self.warm_up_pending.discard(gs.guild_id)
+        now = time.monotonic()
+        batches = dict()  # provider -> [reference]
+        for entry in gs.playlist.head(WARMUP_DEPTH)[self.prefetch_depth:]:
+            provider = entry.provider
+            if not provider.expensive or not provider.cacheable:
+                continue
+            key = (provider.kind, provider.cache_key(entry.reference))
+            if now - self.warmed.get(key, -WARMUP_TTL) < WARMUP_TTL:
+                continue
+
+            self.warmed[key] = now
+            self.warmed.move_to_end(key)
+            batches.setdefault(provider, []).append(entry.reference)
+
+        while len(self.warmed) > MAX_WARMED:
+            self.warmed.popitem(last=False)
+
+        for provider, references in batches.items():
+            for i in range(0, len(references), provider.batch_size):
+                task = asyncio.ensure_future(provider.resolve_batch(references[i:i+provider.batch_size]))
+                task.add_done_callback(report_warm_up)
+
+    def mark_dirty(self, guild_id: int):
+        """The session of the guild has changed and will be written at the next flush.
+        """
+        if self.store is not None:
+            self.dirty.add(guild_id)
+
+    @tasks.loop(seconds=FLUSH_INTERVAL)
+    async def flush_sessions(self):
+        """Write the changed sessions, and the elapsed time of the songs being played, in one batch.
+        """
+        dirty, self.dirty = self.dirty, set()
+        sessions = {
+            guild_id: self.get_guildstate(guild_id).snapshot()
+            for guild_id in dirty
+        }
+        offsets = {
+            guild_id: gs.elapsed()
+            for guild_id, gs in self.guild_states.items()
+            if guild_id not in dirty and gs.current_entry is not None
+        }
+
+        loop = self.bot.loop
+        if sessions:
+            await loop.run_in_executor(None, self.store.save, sessions)
+        if offsets:
+            await loop.run_in_executor(None, self.store.save_offsets, offsets)
+
+    @Cog.listener()
+    async def on_message(self, message: discord.Message):
+        self.outbox.seen(message)
+
+    @Cog.listener()
+    async def on_ready(self):
+        if self.store is not None and not self.resumed:
+            self.resumed = True
+            self.bot.loop.create_task(self.resume_sessions())
+
+    async def resume_sessions(self):
+        """Resume the stored sessions, one at a time so that
+        a restart does not reconnect to all guilds at once.
+        """
+        sessions = await self.bot.loop.run_in_executor(None, self.store.load_all)
+        for guild_id, session in sessions.items():
+            try:
+                if await self.resume_session(guild_id, session):
+                    await asyncio.sleep(RESUME_STAGGER)
+            except Exception as e:
+                print(f'Failed to resume the session of guild {guild_id}: {e}')
+
+    async def resume_session(self, guild_id: int, session: dict) -> bool:
+        """Reconnect to the voice channel and play the stored playlist
+        starting from the stored position.
+
+        Sessions left without any listener are dropped.
+        Return True if the session has been resumed.
+        """
+        self.mark_dirty(guild_id)  # Drops the stored session if it isn't resumed
+        channel = self.bot.get_channel(session['voice_channel_id'])
+        if channel is None or not any(not member.bot for member in channel.members):
+            return False
+
+        entries = []
+        if session['current'] is not None:
+            entries.append(self.stored_entry(session['current'], session['offset']))
+        entries.extend(self.stored_entry(entry) for entry in session['queue'])
+        entries = [entry for entry in entries if entry is not None]
+        radio = session.get('radio')
+        if radio is not None and (radio[0] not in self.providers or not self.providers[radio[0]].supports_radio):
+            radio = None
+        if not entries and radio is None:
+            return False
+
+        gs = self.get_guildstate(guild_id)
+        gs.volume = session.get('volume', 1)
+        if radio is not None:
+            self.set_radio(gs, *radio)
+        gs.voice_client = await channel.connect()
+        for entry in entries:
+            gs.playlist.append(entry)
+        await self.play_next(guild_id)
+        return True
+
+    def stored_entry(self, entry: dict, offset: float = 0) -> QueueEntry:
+        """Rebuild a playlist entry from its stored form.
+        Return None if its kind of source isn't registered.
+        """
+        kind, reference = entry['source']
+        if kind not in self.providers:
+            return None
+
+        return QueueEntry(
+            entry['channel_id'],
+            entry['requester_id'],
+            self.providers[kind],
+            reference,
+            entry['title'],
+            offset,
+        )
 
     def get_guildstate(self, guild_id: int):
         """Return the GuildState associated with the
@@ -62,7 +498,9 @@ class VoiceManager(Cog):
         """
         if guild_id not in self.guild_states:
             self.guild_states[guild_id] = GuildState(guild_id)
-        return self.guild_states[guild_id]
+        gs = self.guild_states[guild_id]
+        gs.last_active = time.monotonic()
+        return gs
 
     async def connect(self, context: Context) -> bool:
         """Connect to the author's voice channel (defined by the context).
@@ -92,20 +530,10 @@ class VoiceManager(Cog):
     async def voice_stop(self, context: Context):
         """Stop the current song.
         """
-        voice = context.author.voice
-        guild = context.guild
-        gs = self.get_guildstate(guild.id)
-
-        if gs.voice_client is None or not gs.voice_client.is_connected() or \
-                not gs.voice_client.is_playing():
-            await context.send('I am not playing anything right now.')
-            return
-
-        if voice is None or voice.channel != gs.voice_client.channel:
-            await context.send("You're not connected to the same voice channel as me.")
+        if not await self.check_same_channel(context):
             return
 
-        await gs.reset()  # Reset all variables
+        await self.reset(context.guild.id)
 
     @command(name='next')
     async def voice_next(self, context: Context):
@@ -113,30 +541,191 @@ class VoiceManager(Cog):
         If there are no songs next, disconnect the bot
         from the channel.
         """
+        if not await self.check_same_channel(context):
+            return
+
+        gs = self.get_guildstate(context.guild.id)
+        if gs.feeder is not None and gs.feeder.skip():
+            return  # The feeder goes on with the staged song
+        gs.voice_client.stop()  # Calls after_play (which does what we want)
+
+    async def check_same_channel(self, context: Context) -> bool:
+        """Make sure the author is listening to the bot.
+        Return False and tell the author otherwise.
+        """
         voice = context.author.voice
-        guild = context.guild
-        gs = self.get_guildstate(guild.id)
+        gs = self.get_guildstate(context.guild.id)
 
         if gs.voice_client is None or not gs.voice_client.is_connected() or\
                 not gs.voice_client.is_playing():
             await context.send('I am not playing anything right now.')
-            return
+            return False
 
         if voice is None or voice.channel != gs.voice_client.channel:
             await context.send("You're not connected to the same voice channel as me.")
+            return False
+
+        return True
+
+    async def check_position(self, context: Context, *positions: int) -> bool:
+        """Make sure the playlist positions (starting at 1) exist.
+        Return False and tell the author otherwise.
+        """
+        gs = self.get_guildstate(context.guild.id)
+        for position in positions:
+            if not 1 <= position <= len(gs.playlist):
+                await context.send(f'There is no song {position} in the playlist.')
+                return False
+        return True
+
+    @command(name='remove')
+    async def voice_remove(self, context: Context, position: int):
+        """Remove the song at the given position of the playlist.
+        """
+        if not await self.check_same_channel(context) or not await self.check_position(context, position):
             return
 
-        gs.voice_client.stop()  # Calls after_play (which does what we want)
+        gs = self.get_guildstate(context.guild.id)
+        gs.playlist.remove(position - 1)
+        self.schedule(gs)
+        self.mark_dirty(gs.guild_id)
+        await context.send(f'Song {position} removed.')
+
+    @command(name='move')
+    async def voice_move(self, context: Context, position: int, new_position: int):
+        """Move a song of the playlist to a new position.
+        """
+        if not await self.check_same_channel(context) or \
+                not await self.check_position(context, position, new_position):
+            return
+
+        gs = self.get_guildstate(context.guild.id)
+        gs.playlist.move(position - 1, new_position - 1)
+        self.schedule(gs)
+        self.mark_dirty(gs.guild_id)
+        await context.send(f'Song {position} moved to position {new_position}.')
+
+    @command(name='shuffle')
+    async def voice_shuffle(self, context: Context):
+        """Shuffle the playlist.
+        """
+        if not await self.check_same_channel(context):
+            return
+
+        gs = self.get_guildstate(context.guild.id)
+        gs.playlist.shuffle()
+        self.schedule(gs)
+        self.mark_dirty(gs.guild_id)
+        await context.send('Playlist shuffled.')
+
+    @command(name='skipto')
+    async def voice_skipto(self, context: Context, position: int):
+        """Skip directly to the song at the given position of the playlist.
+        """
+        if not await self.check_same_channel(context) or not await self.check_position(context, position):
+            return
+
+        gs = self.get_guildstate(context.guild.id)
+        gs.playlist.skipto(position - 1)
+        self.schedule(gs)
+        self.mark_dirty(gs.guild_id)
+        gs.voice_client.stop()  # Calls after_play which plays the next song
+
+    @command(name='volume')
+    async def voice_volume(self, context: Context, percent: int = None):
+        """Show or set the volume, in percent of the default volume (0 to 200).
 
-    def empty_playlist(self, guild_id: int):
+        The new volume is applied by FFmpeg from the next song on.
+        """
+        gs = self.get_guildstate(context.guild.id)
+        if percent is None:
+            await context.send(f'Volume: {round(gs.volume * 100)}%')
+            return
+
+        if not await self.check_same_channel(context):
+            return
+
+        if not 0 <= percent <= 200:
+            await context.send('The volume must be between 0 and 200.')
+            return
+
+        gs.volume = percent / 100
+        gs.cancel_prefetch()  # Prefetched songs have the previous volume
+        gs.prefetch(self.prefetch_depth)
+
+        source = gs.voice_client.source
+        if isinstance(source, GaplessSource):
+            source = source.original
+        if isinstance(source, VolumeSource) and source.scalable:
+            source.set_volume(gs.volume)
+            await context.send(f'Volume set to {percent}%.')
+        else:  # Opus passthrough or silenced by FFmpeg, cannot be scaled
+            await context.send(f'Volume set to {percent}%, from the next song on.')
+
+    @command(name='playlist')
+    async def voice_playlist(self, context: Context):
+        """Display the current playlist.
+        """
+        gs = self.get_guildstate(context.guild.id)
+        await send_pages(
+            self.bot,
+            context,
+            'Playlist',
+            lambda: queue_page_count(gs.playlist),
+            lambda page: render_queue_page(gs.playlist, page, gs.currently_playing),
+        )
+
+    async def reset(self, guild_id: int):
+        """Disconnect and erase the playlist of the guild.
+        """
+        gs = self.get_guildstate(guild_id)
+        await gs.reset()  # Reset all variables
+        self.mark_dirty(guild_id)
+
+    def empty_playlist(self, guild_id: int, gapless: bool = False):
         """Empty the playlist for the given guild.
+
+        If gapless, the songs added next are chained without gaps, like the tracks of an album.
         """
         gs = self.get_guildstate(guild_id)
-        gs.playlist = []
+        gs.playlist.clear()
+        gs.cancel_prefetch()
+        gs.gapless = gapless
+        gs.radio = None
+        gs.radio_origin = None
+        self.mark_dirty(guild_id)
 
-    def add_to_playlist(self, context: Context, fn: callable, args: list):
+    def start_radio(self, context: Context, kind: str):
+        """Play endlessly the songs of the radio of the provider once the playlist is over.
+
+        The radio of the provider registered for this kind is only iterated when songs are needed.
+        """
         gs = self.get_guildstate(context.guild.id)
-        gs.playlist.append((context, fn, args))
+        self.set_radio(gs, kind, context.channel.id, context.author.id)
+        gs.refill()
+        self.schedule(gs)
+        self.mark_dirty(gs.guild_id)
+
+    def set_radio(self, gs: GuildState, kind: str, channel_id: int, requester_id: int):
+        provider = self.providers[kind]
+        if not provider.supports_radio:
+            raise ValueError(f'The {kind} songs cannot be played as a radio')
+        gs.radio = (
+            QueueEntry(channel_id, requester_id, provider, reference, title)
+            for reference, title in provider.radio()
+        )
+        gs.radio_origin = (kind, channel_id, requester_id)
+
+    def add_to_playlist(self, context: Context, kind: str, reference: str, title: str = None):
+        """Add a song at the end of the playlist.
+
+        The song is resolved by the provider registered for its kind, see `register_provider`.
+        """
+        gs = self.get_guildstate(context.guild.id)
+        gs.playlist.append(QueueEntry(context.channel.id, context.author.id, self.providers[kind], reference, title))
+        if len(gs.playlist) <= WARMUP_DEPTH:
+            self.schedule(gs)
+        self.mark_dirty(gs.guild_id)
 
     def is_playing(self, guild_id: int) -> bool:
         gs = self.get_guildstate(guild_id)
@@ -144,43 +733,134 @@ class VoiceManager(Cog):
             return gs.voice_client.is_playing()
         return False
 
-    async def play_next(self, guild_id: int):
+    async def play_next(self, guild_id: int, wait_for_more: bool = False) -> bool:
         """Play the next song in the playlist.
 
         The playlist shouln't be empty.
         The bot should be connected to a voice channel.
         If it is currently playing something, it stops the song and play the next.
         Otherwise, it just plays the next song in the playlist.
+
+        Songs that cannot be resolved (private or removed videos...) are skipped.
+        If none of the remaining songs can be played, the guild is reset,
+        unless more songs are about to be added (`wait_for_more`).
+        Return True if a song is being played.
         """
+        start = time.perf_counter()
         gs = self.get_guildstate(guild_id)
+        if gs.voice_client is None:
+            return False  # Reset meanwhile, e.g. the last song ended while the next one was requested
+
+        if gs.starting:
+            return True  # The next song is already being started by another call
+
+        gs.refill()
         assert len(gs.playlist) > 0, "Playlist empty!"
 
         if gs.voice_client.is_playing():
             gs.voice_client.stop()  # Calls after_play => properly clean up ressources and then calls play_next
-            return
+            return True
+
+        gs.starting = True  # Keeps the guild from being reset by the end of the previous song
+        try:
+            while True:
+                entry = gs.playlist.popleft()
+                task = gs.pop_prefetched(entry)
+                try:
+                    audio_source, infos = await task if task else await entry.resolve(volume=gs.volume)
+                    break
+                except Exception as e:
+                    print(f'Failed to resolve {entry.source}: {e}')
+                    metrics.inc('tracks_played', status='unavailable')
+                    self.outbox.post(entry.channel_id, f'Skipping unavailable song: `{entry.title or entry.reference}`')
+                    self.mark_dirty(guild_id)
+                    gs.refill()
+                    if not gs.playlist:
+                        if not wait_for_more:
+                            await self.reset(guild_id)
+                        return False
+        finally:
+            gs.starting = False
+
+        if gs.voice_client is None:  # Reset while the song was being resolved
+            discard_source(audio_source)
+            return False
 
-        context, fn, args = gs.playlist.pop(0)
-        audio_source, infos = await fn(*args)
+        if gs.gapless:
+            gs.feeder = audio_source = GaplessSource(
+                audio_source,
+                entry,
+                lambda entry, infos: asyncio.run_coroutine_threadsafe(
+                    self.track_changed(guild_id, entry, infos), self.bot.loop),
+            )
+            if getattr(gs.voice_client, 'encoder', False) is None:
+                # The voice client only creates its encoder for PCM sources,
+                # and the feeder may go on with PCM songs after Opus ones
+                gs.voice_client.encoder = discord.opus.Encoder()
+        else:
+            gs.feeder = None
         gs.voice_client.play(audio_source, after=lambda e: self.after_play(e, guild_id))
+        metrics.observe('time_to_first_audio', time.perf_counter() - start, prefetched=task is not None)
+        if gs.ended_at is not None:
+            metrics.observe('track_gap', time.perf_counter() - gs.ended_at, mode='restart')
+            gs.ended_at = None
+        self.now_playing(gs, entry, infos)
+        return True
+
+    async def track_changed(self, guild_id: int, entry: QueueEntry, infos: str):
+        """Called when the feeder of the guild goes on with the staged song.
+        """
+        metrics.inc('tracks_played', status='ok')
+        gs = self.get_guildstate(guild_id)
+        for position, e in enumerate(gs.playlist):
+            if e is entry:
+                gs.playlist.remove(position)
+                break
+        self.now_playing(gs, entry, infos)
+
+    def now_playing(self, gs: GuildState, entry: QueueEntry, infos: str):
+        """Update the state of the guild when a song starts, and announce it.
+        The announce is sent in background, and edits the previous one if possible.
+        """
         gs.currently_playing = infos
-        await context.send(f'Now playing: `{infos}`')
+        gs.current_entry = entry
+        gs.started_at = time.monotonic()
+        gs.start_offset = entry.offset
+        entry.provider.played(entry.reference)
+        gs.refill()
+        self.schedule(gs)  # Resolve the next songs while this one is playing
+        self.mark_dirty(gs.guild_id)
+
+        self.outbox.post(entry.channel_id, f'Now playing: `{infos}`', key='now_playing')
+
+    async def reset_if_idle(self, guild_id: int):
+        """Reset the guild, unless a song has been requested since the last one ended.
+        """
+        gs = self.get_guildstate(guild_id)
+        if gs.playlist or gs.starting or (gs.voice_client is not None and gs.voice_client.is_playing()):
+            return
+        await self.reset(guild_id)
 
     def after_play(self, error, guild_id: int):
         """Called when a song is finished.
 
         The bot either plays the next song if there is one, or disconnect.
         """
+        metrics.inc('tracks_played', status='error' if error else 'ok')
         gs = self.get_guildstate(guild_id)
+        gs.ended_at = time.perf_counter()
         if not gs.voice_client or not gs.voice_client.is_connected():
             return  # Nothing to do
 
-        if gs.playlist == []:  # Nothing to play next
-            coro = gs.reset()
+        if not gs.playlist and gs.radio is None:  # Nothing to play next
+            coro = self.reset_if_idle(guild_id)
             asyncio.run_coroutine_threadsafe(coro, self.bot.loop)
             return
 
+        self.mark_dirty(guild_id)
         # Cleanup ending source
-        gs.cleanup_source()
+        if gs.cleanup_source():
+            self.reaper_stats['processes_killed'] += 1
         # Plays the next song
         coro = self.play_next(guild_id)
         asyncio.run_coroutine_threadsafe(coro, self.bot.loop)
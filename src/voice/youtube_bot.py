@@ -7,14 +7,24 @@ Thanks to @Vinicius Mesquita for his post on SO: https://stackoverflow.com/quest
 
 Requirements: YoutubDl, ffmpeg, PyNaCl
 """
+import os
+import asyncio
+import threading
 from typing import Optional
+from urllib.parse import urlparse, parse_qs
 
-import discord
+from discord.ext import tasks
 from discord.ext.commands import Cog, Bot, Context, command
 
 import youtube_dl
 
+from src.instrumentation import metrics
+from src.voice.audio import VolumeSource, ffmpeg_source
+from src.voice.download_cache import DownloadCache
+from src.voice.providers import SourceProvider
 from src.voice.voice_manager import VoiceManager
+from src.voice.ytdl_cache import ExtractionCache, cache_key
+from src.voice.ytdl_pool import ExtractionPool, PoolBusy
 
 
 youtube_dl.utils.bug_reports_message = lambda e: print('Error:', e)
@@ -36,12 +46,30 @@ ytdl_format_options = {
 ffmpeg_options = {
     'options': '-vn'
 }
+YTDL_VOLUME = 0.5
+CACHE_SAVE_INTERVAL = 60  # Seconds between two saves of the download cache index
 
-ytdl = youtube_dl.YoutubeDL(ytdl_format_options)
+ytdl_pool = ExtractionPool(
+    ytdl_format_options,
+    workers=int(os.getenv('YTDL_WORKERS', 4)),
+    max_pending=int(os.getenv('YTDL_MAX_PENDING', 32)),
+    max_per_guild=int(os.getenv('YTDL_MAX_PER_GUILD', 2)),
+)
+ytdl_cache = ExtractionCache(ytdl_pool.extract, executor=ytdl_pool.executor)
+download_cache = DownloadCache(
+    None,  # Opened by the YoutubeBot, in the directory of its shard
+    ytdl_pool.download_to,
+    max_bytes=int(os.getenv('YT_CACHE_BYTES', 2 * 2**30)),
+    threshold=int(os.getenv('YT_CACHE_THRESHOLD', 3)),
+)
+metrics.gauge('download_cache_bytes', download_cache.size)
+metrics.gauge('ytdl_cache_hits', lambda: ytdl_cache.hits)
+metrics.gauge('ytdl_cache_misses', lambda: ytdl_cache.misses)
+metrics.gauge('ytdl_pending', lambda: ytdl_pool.pending)
 
 
-class YTDLSource(discord.PCMVolumeTransformer):
-    def __init__(self, source, *, data, volume=0.5):
+class YTDLSource(VolumeSource):
+    def __init__(self, source, *, data, volume=1):
         super().__init__(source, volume)
 
         self.data = data
@@ -55,23 +83,115 @@ class YTDLSource(discord.PCMVolumeTransformer):
             url: str,
             *,
             loop=None,
-            stream: bool = False
+            stream: bool = False,
+            offset: float = 0,
+            volume: float = 1,
         ):
         loop = loop or asyncio.get_event_loop()
-        data = await loop.run_in_executor(None, lambda: ytdl.extract_info(url, download=not stream))
+        data = await ytdl_cache.extract_info(url, loop)
 
         if 'entries' in data:
             # take first item from a playlist
             data = data['entries'][0]
 
-        filename = data['url'] if stream else ytdl.prepare_filename(data)
-        return cls(discord.FFmpegPCMAudio(filename, **ffmpeg_options), data=data)
+        # Frequently played songs are read from the local download cache
+        video_id = data['id']
+        if stream:
+            filename = download_cache.get(video_id) or data['url']
+        else:
+            filename = await download_cache.fetch(video_id, data.get('webpage_url', url))
+        source = ffmpeg_source(filename, YTDL_VOLUME * volume, offset, **ffmpeg_options)
+        return cls(source, data=data, volume=volume)
+
+
+def is_playlist_url(url: str) -> bool:
+    """Whether the URL is a Youtube playlist (and not a video inside a playlist).
+    """
+    parsed = urlparse(url.strip())
+    return parsed.path == '/playlist' and 'list' in parse_qs(parsed.query)
+
+
+def entry_url(entry: dict) -> str:
+    """Return the URL of a flat playlist entry.
+    """
+    url = entry.get('url') or entry['id']
+    if entry.get('ie_key') == 'Youtube' or not url.startswith('http'):
+        return f'https://www.youtube.com/watch?v={entry["id"]}'
+    return url
+
+
+class YoutubeProvider(SourceProvider):
+    """Youtube songs, referenced by their URL.
+
+    Extracting the stream of a song takes seconds, so the songs are warmed up ahead
+    into the extraction cache, as many at once as there are extraction workers.
+    """
+    kind = 'youtube'
+    expensive = True
+    cacheable = True
+
+    def __init__(self, bot: Bot):
+        self.bot = bot
+        self.batch_size = ytdl_pool.workers
+
+    async def resolve(self, url: str, offset: float = 0, volume: float = 1) -> tuple:
+        with metrics.timer('audiosource', source='youtube'):
+            audio_source = await YTDLSource.from_url(
+                url,
+                loop=self.bot.loop,
+                stream=True,
+                offset=offset,
+                volume=volume,
+            )
+        infos = f'{audio_source.data["title"]}'
+        return audio_source, infos
+
+    def played(self, url: str):
+        """Count the play for the download cache.
+        The song has just been resolved, so its extraction is cached.
+        """
+        data = ytdl_cache.get(cache_key(url))
+        if data is None:
+            return  # Expired meanwhile, the play is not counted
+
+        if 'entries' in data:
+            data = data['entries'][0]
+        download_cache.record_play(data['id'], data.get('webpage_url', url))
+
+    async def prefetch(self, url: str):
+        if ytdl_pool.pending >= ytdl_pool.max_pending:
+            return  # Commands come first
+        await ytdl_cache.extract_info(url, self.bot.loop)
+
+    def cache_key(self, url: str) -> str:
+        return cache_key(url)
 
 
 class YoutubeBot(Cog):
-    def __init__(self, bot: Bot, voice_manager: VoiceManager):
+    """Commands to listen to Youtube songs.
+
+    Frequently played songs are downloaded into `cache_dir`,
+    which must not be shared with the other shard processes.
+    """
+    def __init__(self, bot: Bot, voice_manager: VoiceManager, cache_dir: str = 'yt_cache'):
         self.bot = bot
         self.voice_manager = voice_manager
+        self.voice_manager.register_provider(YoutubeProvider(bot))
+        download_cache.open(cache_dir)
+        self.save_download_cache.start()
+
+    def cog_unload(self):
+        self.save_download_cache.cancel()
+        download_cache.save_index()
+
+    @tasks.loop(seconds=CACHE_SAVE_INTERVAL)
+    async def save_download_cache(self):
+        """Save the play counts of the songs, so that they survive restarts.
+        """
+        try:
+            await download_cache.save()
+        except OSError as e:
+            print(f'Failed to save the download cache index: {e}')
 
     @command(name='play')
     async def yt_play(
@@ -89,24 +209,78 @@ class YoutubeBot(Cog):
 
         guild_id = context.guild.id
 
-        loop = self.bot.loop
-        data = await loop.run_in_executor(None, lambda: ytdl.extract_info(url, download=False))
+        if is_playlist_url(url):
+            await self.yt_playlist(context, url)
+            return
+
+        try:
+            with ytdl_pool.admit(guild_id), metrics.timer('ytdl_extraction', command='play'):
+                data = await ytdl_cache.extract_info(url, self.bot.loop)
+        except PoolBusy:
+            await context.send('Queue busy, try again in a few seconds.')
+            return
+
         if '_type' in data and data['_type'] == 'playlist':
             data = data['entries'][0]
 
+        # The last song may have ended during the extraction, disconnecting the bot
+        if not await self.voice_manager.connect(context):
+            return
+
         info = f'{data["title"]}'
-        self.voice_manager.add_to_playlist(
-            context,
-            self.get_audiosource,
-            [url],
-        )
+        self.voice_manager.add_to_playlist(context, 'youtube', url, title=info)
 
         if not self.voice_manager.is_playing(guild_id):
             await self.voice_manager.play_next(guild_id)
         else:
-            await context.send(f'Added to playlist: {info}')
+            self.voice_manager.outbox.post(
+                context.channel.id, f'Added to playlist: {info}', key='added', merge=True)
 
-    async def get_audiosource(self, url: str) -> tuple[discord.FFmpegPCMAudio, str]:
-        audio_source = await YTDLSource.from_url(url, loop=self.bot.loop, stream=True)
-        infos = f'{audio_source.data["title"]}'
-        return audio_source, infos
+    async def yt_playlist(self, context: Context, url: str):
+        """Add all songs of the Youtube playlist.
+
+        Entries are listed without being resolved, and are added to the playlist as they arrive.
+        Their stream is resolved only when they are about to be played.
+        """
+        guild_id = context.guild.id
+        gs = self.voice_manager.get_guildstate(guild_id)
+        loop = self.bot.loop
+        entries = asyncio.Queue()
+        stop = threading.Event()
+        start_playing = not self.voice_manager.is_playing(guild_id)
+        added = 0
+
+        try:
+            with ytdl_pool.admit(guild_id):
+                listing = loop.run_in_executor(
+                    ytdl_pool.executor,
+                    ytdl_pool.iter_flat,
+                    url,
+                    lambda entry: loop.call_soon_threadsafe(entries.put_nowait, entry),
+                    stop,
+                )
+                listing.add_done_callback(lambda _: entries.put_nowait(None))
+
+                try:
+                    while (entry := await entries.get()) is not None:
+                        if gs.voice_client is None:  # Stopped while listing the playlist
+                            break
+
+                        self.voice_manager.add_to_playlist(
+                            context, 'youtube', entry_url(entry), title=entry.get('title'))
+                        added += 1
+                        if start_playing:
+                            # Unavailable entries are skipped, the next ones are tried as they arrive
+                            start_playing = not await self.voice_manager.play_next(guild_id, wait_for_more=True)
+                finally:
+                    stop.set()  # Make sure the listing ends if we stop early
+
+                await listing
+        except PoolBusy:
+            await context.send('Queue busy, try again in a few seconds.')
+            return
+
+        if start_playing and added and gs.voice_client is not None:  # None of the songs could be played
+            await self.voice_manager.reset(guild_id)
+
+        await context.send(f'Added {added} songs to the playlist.')
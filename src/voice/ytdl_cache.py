@@ -0,0 +1,132 @@
+"""Shared cache of youtube_dl extractions.
+
+Extracted infos are cached by video ID (or normalized URL) with a LRU bound.
+Entries expire before the stream URL they contain does,
+and concurrent extractions of the same URL are coalesced into one.
+"""
+import time
+import asyncio
+from collections import OrderedDict
+from urllib.parse import urlparse, parse_qs
+
+
+DEFAULT_TTL = 3600  # In seconds
+EXPIRY_MARGIN = 300  # Keep a margin so that a cached stream URL is still valid when played
+
+
+def cache_key(url: str) -> str:
+    """Return the video ID of a Youtube URL, or the normalized URL otherwise.
+    """
+    url = url.strip()
+    parsed = urlparse(url)
+    host = parsed.netloc.lower()
+    if host.startswith('www.') or host.startswith('m.'):
+        host = host.split('.', 1)[1]
+
+    video_id = None
+    if host == 'youtu.be':
+        video_id = parsed.path.strip('/')
+    elif host in ('youtube.com', 'music.youtube.com'):
+        if parsed.path == '/watch':
+            video_id = parse_qs(parsed.query).get('v', [None])[0]
+        elif parsed.path.startswith('/shorts/'):
+            video_id = parsed.path.split('/')[2]
+    if video_id:  # URLs without an ID are kept as URLs
+        return 'youtube:' + video_id
+
+    if not parsed.scheme:  # Search terms
+        return 'search:' + ' '.join(url.lower().split())
+    return parsed._replace(netloc=host, fragment='').geturl()
+
+
+def stream_ttl(data: dict, default_ttl: float = DEFAULT_TTL) -> float:
+    """Time to live of the extracted infos, given the expiry of their stream URL.
+    """
+    if 'entries' in data and data['entries']:
+        data = data['entries'][0]
+
+    expire = parse_qs(urlparse(data.get('url') or '').query).get('expire')
+    if not expire:
+        return default_ttl
+
+    try:
+        remaining = int(expire[0]) - time.time() - EXPIRY_MARGIN
+    except ValueError:
+        return default_ttl
+    return max(0, min(default_ttl, remaining))
+
+
+class ExtractionCache:
+    """LRU cache of `extract(url)` results, with TTLs and coalesced in-flight requests.
+
+    The blocking `extract` function is run in the given executor.
+    """
+    def __init__(self, extract: callable, maxsize: int = 512, default_ttl: float = DEFAULT_TTL, executor=None):
+        self.extract = extract
+        self.maxsize = maxsize
+        self.default_ttl = default_ttl
+        self.executor = executor
+        self.entries = OrderedDict()  # key -> (expiry time, data)
+        self.in_flight = dict()  # key -> Future
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> dict:
+        """Return the cached data of the key, None if missing or expired.
+        """
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+
+        expiry, data = entry
+        if expiry <= time.monotonic():
+            del self.entries[key]
+            return None
+
+        self.entries.move_to_end(key)
+        return data
+
+    def put(self, key: str, data: dict):
+        ttl = stream_ttl(data, self.default_ttl)
+        if ttl <= 0:
+            return
+
+        self.entries[key] = (time.monotonic() + ttl, data)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    async def extract_info(self, url: str, loop: asyncio.AbstractEventLoop = None) -> dict:
+        """Return the extracted infos of the URL, from the cache if possible.
+        """
+        key = cache_key(url)
+        data = self.get(key)
+        if data is not None:
+            self.hits += 1
+            return data
+
+        if key in self.in_flight:  # Someone is already extracting this URL
+            self.hits += 1
+            return await asyncio.shield(self.in_flight[key])
+
+        self.misses += 1
+        loop = loop or asyncio.get_event_loop()
+        future = loop.run_in_executor(self.executor, self.extract, url)
+        self.in_flight[key] = future
+        future.add_done_callback(lambda f: self.extraction_done(key, f))
+        return await asyncio.shield(future)
+
+    def extraction_done(self, key: str, future: asyncio.Future):
+        """Cache the extraction result, even if all its waiters have been cancelled.
+        """
+        del self.in_flight[key]
+        if not future.cancelled() and future.exception() is None:
+            self.put(key, future.result())
+
+    def stats(self) -> dict:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self.entries),
+            'in_flight': len(self.in_flight),
+        }
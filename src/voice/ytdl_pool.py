@@ -0,0 +1,98 @@
+"""Dedicated pool of threads for youtube_dl work.
+
+Each worker owns its own YoutubeDL instance, and the pool is separate from the
+default executor of the event loop so that extractions never starve other blocking calls.
+Admission is bounded per guild and globally: when the pool is busy,
+new requests are refused instead of being queued indefinitely.
+"""
+import os
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+import youtube_dl
+
+
+class PoolBusy(Exception):
+    """Raised when a request cannot be admitted in the pool.
+    """
+
+
+class ExtractionPool:
+    """Bounded pool of youtube_dl workers.
+    """
+    def __init__(self, ytdl_options: dict, workers: int = 4, max_pending: int = 32, max_per_guild: int = 2):
+        self.ytdl_options = ytdl_options
+        self.workers = workers
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='ytdl')
+        self.local = threading.local()
+        self.max_pending = max_pending
+        self.max_per_guild = max_per_guild
+        self.pending = 0
+        self.pending_per_guild = dict()  # guild.id -> number of pending requests
+
+    def ytdl(self) -> youtube_dl.YoutubeDL:
+        """Return the YoutubeDL instance of the current worker.
+        """
+        if not hasattr(self.local, 'ytdl'):
+            self.local.ytdl = youtube_dl.YoutubeDL(self.ytdl_options)
+        return self.local.ytdl
+
+    def flat_ytdl(self) -> youtube_dl.YoutubeDL:
+        """Return the YoutubeDL instance of the current worker used to list playlists.
+        Only the IDs and titles of the entries are extracted.
+        """
+        if not hasattr(self.local, 'flat_ytdl'):
+            options = dict(self.ytdl_options, extract_flat='in_playlist', noplaylist=False)
+            self.local.flat_ytdl = youtube_dl.YoutubeDL(options)
+        return self.local.flat_ytdl
+
+    def extract(self, url: str) -> dict:
+        """Extract the infos of the URL, without downloading.
+        Must be run inside the pool.
+        """
+        return self.ytdl().extract_info(url, download=False)
+
+    def iter_flat(self, url: str, on_entry: callable, stop: threading.Event):
+        """List the entries of the playlist, calling `on_entry` as soon as each of them is known.
+        Stops early if `stop` is set.
+        Must be run inside the pool.
+        """
+        data = self.flat_ytdl().extract_info(url, download=False, process=False)
+        entries = data.get('entries') if data.get('_type') in ('playlist', 'multi_video') else [data]
+        for entry in entries or []:
+            if stop.is_set():
+                return
+            if entry:
+                on_entry(entry)
+
+    def download_to(self, url: str, directory: str) -> str:
+        """Download the URL into the directory and return the path of the file.
+        Must be run inside a thread.
+        """
+        options = dict(self.ytdl_options, outtmpl=os.path.join(directory, '%(id)s.%(ext)s'))
+        ytdl = youtube_dl.YoutubeDL(options)
+        data = ytdl.extract_info(url, download=True)
+        if 'entries' in data:
+            data = data['entries'][0]
+        return ytdl.prepare_filename(data)
+
+    @contextmanager
+    def admit(self, guild_id: int):
+        """Reserve a slot for a request of the guild.
+
+        Raise PoolBusy if the guild or the whole pool has too many pending requests.
+        """
+        guild_pending = self.pending_per_guild.get(guild_id, 0)
+        if self.pending >= self.max_pending or guild_pending >= self.max_per_guild:
+            raise PoolBusy()
+
+        self.pending += 1
+        self.pending_per_guild[guild_id] = guild_pending + 1
+        try:
+            yield
+        finally:
+            self.pending -= 1
+            self.pending_per_guild[guild_id] -= 1
+            if self.pending_per_guild[guild_id] == 0:
+                del self.pending_per_guild[guild_id]
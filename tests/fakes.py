@@ -0,0 +1,34 @@
+"""Fake discord objects shared by the tests and the benchmarks.
+"""
+import asyncio
+
+
+class FakeMember:
+    bot = False
+
+    def __init__(self, member_id: int):
+        self.id = member_id
+
+
+class FakeTextChannel:
+    def __init__(self, channel_id: int):
+        self.id = channel_id
+
+    async def send(self, *args, **kwargs):
+        pass
+
+
+class FakeBot:
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.user = None
+        self.guilds = []
+
+    def get_channel(self, channel_id: int) -> FakeTextChannel:
+        return FakeTextChannel(channel_id)
+
+    async def wait_until_ready(self):
+        pass
+
+    def is_ready(self) -> bool:
+        return True
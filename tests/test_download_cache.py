@@ -0,0 +1,126 @@
+"""Download cache of the frequently played Youtube songs.
+"""
+import os
+import time
+import asyncio
+
+from src.voice import download_cache as download_cache_module
+from src.voice.download_cache import DownloadCache
+
+
+class FakeDownloader:
+    """Writes `size` bytes for each URL, or raises if the URL is in `failing`.
+    """
+    def __init__(self, size: int = 10):
+        self.size = size
+        self.failing = set()
+        self.downloads = []
+
+    def __call__(self, url: str, directory: str) -> str:
+        self.downloads.append(url)
+        if url in self.failing:
+            raise OSError(f'{url} is unavailable')
+
+        path = os.path.join(directory, 'song.m4a')
+        with open(path, 'wb') as f:
+            f.write(b'\0' * self.size)
+        return path
+
+
+def run(coro):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+async def settle(cache: DownloadCache):
+    """Wait for the background downloads.
+    """
+    while cache.in_flight:
+        await asyncio.gather(*cache.in_flight.values(), return_exceptions=True)
+    await asyncio.sleep(0)  # Let the done-callbacks run
+
+
+def test_threshold(tmp_path):
+    downloader = FakeDownloader()
+    cache = DownloadCache(str(tmp_path), downloader, threshold=3)
+
+    async def scenario():
+        for _ in range(2):
+            cache.record_play('a', 'url-a')
+        await settle(cache)
+        assert not downloader.downloads
+        assert cache.get('a') is None
+
+        cache.record_play('a', 'url-a')
+        await settle(cache)
+        assert downloader.downloads == ['url-a']
+        assert os.path.isfile(cache.get('a'))
+
+        cache.record_play('a', 'url-a')  # Already cached
+        await settle(cache)
+        assert downloader.downloads == ['url-a']
+
+    run(scenario())
+
+
+def test_eviction(tmp_path):
+    cache = DownloadCache(str(tmp_path), FakeDownloader(size=10), max_bytes=25)
+
+    async def scenario():
+        await cache.fetch('a', 'url-a')
+        await cache.fetch('b', 'url-b')
+        time.sleep(0.01)
+        cache.get('a')  # b is now the least recently used
+        await cache.fetch('c', 'url-c')
+
+    run(scenario())
+    assert set(cache.entries) == {'a', 'c'}
+    assert cache.size() <= 25
+    assert not os.path.exists(os.path.join(str(tmp_path), 'b.m4a'))
+
+
+def test_backoff(tmp_path, monkeypatch):
+    downloader = FakeDownloader()
+    downloader.failing.add('url-a')
+    cache = DownloadCache(str(tmp_path), downloader, threshold=1)
+    now = [1000.0]
+    monkeypatch.setattr(download_cache_module.time, 'monotonic', lambda: now[0])
+
+    async def scenario():
+        cache.record_play('a', 'url-a')
+        await settle(cache)
+        assert downloader.downloads == ['url-a']
+        assert cache.failures['a'][0] == 1
+
+        cache.record_play('a', 'url-a')  # Too early to retry
+        await settle(cache)
+        assert downloader.downloads == ['url-a']
+
+        now[0] += download_cache_module.RETRY_DELAY + 1
+        cache.record_play('a', 'url-a')
+        await settle(cache)
+        assert downloader.downloads == ['url-a', 'url-a']
+        assert cache.failures['a'][0] == 2  # The delay doubles
+
+        now[0] += download_cache_module.RETRY_DELAY + 1
+        cache.record_play('a', 'url-a')
+        await settle(cache)
+        assert len(downloader.downloads) == 2
+
+    run(scenario())
+
+
+def test_plays_survive_restarts(tmp_path):
+    cache = DownloadCache(str(tmp_path), FakeDownloader(), threshold=3)
+
+    async def scenario():
+        cache.record_play('a', 'url-a')
+        cache.record_play('a', 'url-a')
+        await cache.save()
+
+    run(scenario())
+    assert not cache.dirty
+    assert DownloadCache(str(tmp_path), FakeDownloader()).plays == {'a': 2}
@@ -0,0 +1,187 @@
+"""Sessions stored by the VoiceManager and resumed after a restart.
+
+Run with `python3 -m pytest tests`.
+"""
+import asyncio
+import itertools
+
+from tests.fakes import FakeBot, FakeMember, FakeTextChannel
+from src.voice.providers import SourceProvider
+from src.voice.session_store import SQLiteSessionStore
+from src.voice.voice_manager import RADIO_QUEUED, VoiceManager
+
+
+GUILD_ID = 1
+VOICE_CHANNEL_ID = 10
+TEXT_CHANNEL_ID = 20
+
+
+class FakeSource:
+    def read(self) -> bytes:
+        return b''
+
+    def is_opus(self) -> bool:
+        return False
+
+    def cleanup(self):
+        pass
+
+
+class FakeProvider(SourceProvider):
+    """Resolves any reference to a silent source, and remembers the resolutions.
+    """
+    kind = 'fake'
+    supports_radio = True
+
+    def __init__(self):
+        self.resolved = []  # [(reference, offset)]
+        self.played_references = []
+
+    async def resolve(self, reference: str, offset: float = 0, volume: float = 1) -> tuple:
+        self.resolved.append((reference, offset))
+        return FakeSource(), reference
+
+    def played(self, reference: str):
+        self.played_references.append(reference)
+
+    def radio(self):
+        for i in itertools.count():
+            yield f'radio {i}', f'radio {i}'
+
+
+class FakeVoiceClient:
+    """Keeps the source being played until it is stopped.
+    """
+    def __init__(self, channel):
+        self.channel = channel
+        self.source = None
+        self.connected = True
+
+    def is_connected(self) -> bool:
+        return self.connected
+
+    def is_playing(self) -> bool:
+        return self.source is not None
+
+    def play(self, source, after: callable):
+        self.source = source
+
+    def stop(self):
+        self.source = None
+
+    async def disconnect(self):
+        self.stop()
+        self.connected = False
+
+
+class FakeVoiceChannel:
+    def __init__(self, channel_id: int, members: list):
+        self.id = channel_id
+        self.members = members
+
+    async def connect(self) -> FakeVoiceClient:
+        return FakeVoiceClient(self)
+
+
+class ResumeBot(FakeBot):
+    def __init__(self, loop: asyncio.AbstractEventLoop, voice_channel: FakeVoiceChannel):
+        super().__init__(loop)
+        self.voice_channel = voice_channel
+
+    def get_channel(self, channel_id: int):
+        if channel_id == self.voice_channel.id:
+            return self.voice_channel
+        return FakeTextChannel(channel_id)
+
+
+def stored_entry(title: str) -> dict:
+    return {
+        'channel_id': TEXT_CHANNEL_ID,
+        'requester_id': 2,
+        'title': title,
+        'source': ('fake', title),
+    }
+
+
+def stored_session() -> dict:
+    return {
+        'voice_channel_id': VOICE_CHANNEL_ID,
+        'current': stored_entry('song 1'),
+        'offset': 42,
+        'volume': 0.5,
+        'queue': [stored_entry('song 2'), stored_entry('song 3')],
+    }
+
+
+def run(members: list, check: callable, session: dict = None):
+    """Resume the stored session with the given members in the voice channel,
+    flush the sessions, and give the results to `check`.
+    """
+    session = session or stored_session()
+
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        store = SQLiteSessionStore(':memory:')
+        voice_manager = VoiceManager(ResumeBot(loop, FakeVoiceChannel(VOICE_CHANNEL_ID, members)), store=store)
+        provider = FakeProvider()
+        voice_manager.register_provider(provider)
+        try:
+            store.save({GUILD_ID: session})
+            resumed = await voice_manager.resume_session(GUILD_ID, store.load_all()[GUILD_ID])
+            await voice_manager.flush_sessions.coro(voice_manager)
+            check(resumed, voice_manager, provider, store.load_all())
+        finally:
+            voice_manager.cog_unload()
+            store.close()
+
+    # The cogs tasks are bound to the default event loop
+    asyncio.get_event_loop().run_until_complete(scenario())
+
+
+def test_resume_session():
+    def check(resumed, voice_manager, provider, sessions):
+        assert resumed
+        gs = voice_manager.guild_states[GUILD_ID]
+        assert gs.voice_client.is_connected()
+        assert gs.voice_client.channel.id == VOICE_CHANNEL_ID
+        assert gs.voice_client.is_playing()
+        assert gs.volume == 0.5
+        assert gs.current_entry.title == 'song 1'
+        assert ('song 1', 42) in provider.resolved  # The current song restarts at its offset
+        assert [entry.title for entry in gs.playlist] == ['song 2', 'song 3']
+        assert provider.played_references == ['song 1']
+
+        session = sessions[GUILD_ID]
+        assert session['voice_channel_id'] == VOICE_CHANNEL_ID
+        assert session['current']['title'] == 'song 1'
+        assert [entry['title'] for entry in session['queue']] == ['song 2', 'song 3']
+        assert session['offset'] >= 42
+
+    run([FakeMember(2)], check)
+
+
+def test_resume_radio():
+    session = stored_session()
+    session['queue'] = []
+    session['radio'] = ('fake', TEXT_CHANNEL_ID, 2)
+
+    def check(resumed, voice_manager, provider, sessions):
+        assert resumed
+        gs = voice_manager.guild_states[GUILD_ID]
+        assert gs.current_entry.title == 'song 1'
+        assert len(gs.playlist) == RADIO_QUEUED  # Refilled by the radio
+        assert sessions[GUILD_ID]['radio'] == ['fake', TEXT_CHANNEL_ID, 2]
+
+    run([FakeMember(2)], check, session)
+
+
+def test_resume_session_without_listeners():
+    bot_member = FakeMember(3)
+    bot_member.bot = True
+
+    def check(resumed, voice_manager, provider, sessions):
+        assert not resumed
+        assert not provider.resolved
+        assert GUILD_ID not in sessions  # Dropped by the flush
+
+    run([bot_member], check)
@@ -0,0 +1,107 @@
+"""Shared cache of the youtube_dl extractions.
+"""
+import time
+import asyncio
+import threading
+
+from src.voice import ytdl_cache as ytdl_cache_module
+from src.voice.ytdl_cache import ExtractionCache, cache_key
+
+
+def run(coro):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+def test_cache_key_video_urls():
+    keys = {
+        cache_key('https://www.youtube.com/watch?v=abc'),
+        cache_key('https://m.youtube.com/watch?v=abc&list=PL1&t=42'),
+        cache_key('https://music.youtube.com/watch?v=abc'),
+        cache_key('https://youtu.be/abc?t=3'),
+        cache_key('https://youtube.com/shorts/abc'),
+        cache_key('  https://youtu.be/abc  '),
+    }
+    assert keys == {'youtube:abc'}
+
+
+def test_cache_key_without_video_id():
+    assert cache_key('https://www.youtube.com/shorts/') == 'https://youtube.com/shorts/'
+    assert cache_key('https://youtu.be/') == 'https://youtu.be/'
+    assert cache_key('https://www.youtube.com/watch?list=PL1') == 'https://youtube.com/watch?list=PL1'
+
+
+def test_cache_key_other_urls_and_searches():
+    assert cache_key('https://www.example.com/song.mp3#start') == 'https://example.com/song.mp3'
+    assert cache_key('Never gonna  give') == cache_key('never gonna give') == 'search:never gonna give'
+
+
+def test_ttl_expiry(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(ytdl_cache_module.time, 'monotonic', lambda: now[0])
+    extractions = []
+
+    def extract(url: str) -> dict:
+        extractions.append(url)
+        return {'id': 'abc', 'url': 'https://stream/abc'}  # No expiry, the default TTL applies
+
+    cache = ExtractionCache(extract, default_ttl=60)
+
+    async def scenario():
+        await cache.extract_info('https://youtu.be/abc')
+        now[0] += 59
+        await cache.extract_info('https://www.youtube.com/watch?v=abc')
+        assert len(extractions) == 1
+
+        now[0] += 2
+        await cache.extract_info('https://youtu.be/abc')
+        assert len(extractions) == 2
+
+    run(scenario())
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_stream_expiry_shortens_ttl():
+    expire = int(time.time()) + ytdl_cache_module.EXPIRY_MARGIN + 100
+    data = {'url': f'https://stream/abc?expire={expire}'}
+    assert 90 < ytdl_cache_module.stream_ttl(data, default_ttl=3600) <= 100
+
+    expired = {'url': f'https://stream/abc?expire={int(time.time())}'}
+    cache = ExtractionCache(lambda url: expired)
+    cache.put('youtube:abc', expired)
+    assert cache.get('youtube:abc') is None  # Never cached
+
+
+def test_concurrent_misses_are_coalesced():
+    started = threading.Event()
+    release = threading.Event()
+    extractions = []
+
+    def extract(url: str) -> dict:
+        extractions.append(url)
+        started.set()
+        release.wait(5)
+        return {'id': 'abc', 'url': 'https://stream/abc'}
+
+    cache = ExtractionCache(extract)
+
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        first = asyncio.ensure_future(cache.extract_info('https://youtu.be/abc'))
+        await loop.run_in_executor(None, started.wait, 5)
+        others = [
+            asyncio.ensure_future(cache.extract_info(url))
+            for url in ('https://youtu.be/abc', 'https://www.youtube.com/watch?v=abc')
+        ]
+        await asyncio.sleep(0)
+        release.set()
+        return await asyncio.gather(first, *others)
+
+    results = run(scenario())
+    assert len(extractions) == 1
+    assert all(result is results[0] for result in results)
+    assert (cache.hits, cache.misses) == (2, 1)
+    assert not cache.in_flight